@@ -0,0 +1,118 @@
+# app/cache.py
+from __future__ import annotations
+import hashlib, threading, time
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .db import current_generation
+from .settings import settings
+
+# Responses only change when a refresh lands, so everything here is keyed on
+# the refresh generation (see db.bump_generation). Workers share nothing but
+# the refresh_state row.
+
+
+class GenerationClock:
+    """Per-process view of refresh_state, re-read at most every `ttl` seconds."""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.app.generation_check_seconds if ttl is None else ttl
+        self._value: Optional[Tuple[int, datetime]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, engine: Engine) -> Tuple[int, datetime]:
+        if self._value is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() - self._checked_at >= self.ttl:
+                with engine.begin() as c:
+                    self._value = current_generation(c)
+                self._checked_at = time.monotonic()
+            return self._value
+
+    async def aget(self, engine: AsyncEngine) -> Tuple[int, datetime]:
+        if self._value is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._value
+        # no lock across the await; concurrent re-reads of one row are harmless
+        async with engine.connect() as c:
+            value = await c.run_sync(current_generation)
+        self._value, self._checked_at = value, time.monotonic()
+        return value
+
+
+class ResponseCache:
+    """Size-bounded LRU of rendered bodies keyed by (endpoint, params, generation)."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.maxsize = settings.app.cache_max_entries if maxsize is None else maxsize
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._data.get(key)
+            if body is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return body
+
+    def _store(self, key: Hashable, body: bytes) -> None:
+        with self._lock:
+            self._data[key] = body
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_build(self, key: Hashable, build: Callable[[], bytes]) -> bytes:
+        body = self._lookup(key)
+        if body is None:
+            body = build()  # outside the lock; a racing duplicate build is harmless
+            self._store(key, body)
+        return body
+
+    async def aget_or_build(self, key: Hashable, build: Callable[[], Awaitable[bytes]]) -> bytes:
+        body = self._lookup(key)
+        if body is None:
+            body = await build()
+            self._store(key, body)
+        return body
+
+
+def make_etag(endpoint: str, params: Dict[str, Any], generation: int) -> str:
+    digest = hashlib.sha1(repr(sorted(params.items())).encode("utf-8")).hexdigest()[:16]
+    return f'"{endpoint}-{generation}-{digest}"'
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    # a compressed body is a different representation, so a different validator
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+def validator_headers(etag: str, last_modified: datetime) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.replace(microsecond=0), usegmt=True),
+        # let browsers/CDNs keep a copy but always revalidate (cheap 304)
+        "Cache-Control": "public, max-age=0, must-revalidate",
+    }
+
+
+def not_modified(req_headers: Any, etag: str, last_modified: datetime) -> bool:
+    inm = req_headers.get("if-none-match")
+    if inm is not None:
+        return etag in [t.strip().removeprefix("W/") for t in inm.split(",")] or inm.strip() == "*"
+    ims = req_headers.get("if-modified-since")
+    if ims:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
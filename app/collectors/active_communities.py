@@ -1,86 +1,183 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-import logging
-import requests
-from bs4 import BeautifulSoup
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import date, datetime
+import asyncio, logging, re, time
+import httpx
+import lxml.html
+from lxml import etree
+from dateutil import parser as dateparser
 from zoneinfo import ZoneInfo
-from ..settings import settings
-from .common import Facility, normalize_record
+from .common import Facility, facility_fields, normalize_record, row_tuple, rows_from_tuples
+from . import parse_pool
+from .fetch_cache import FetchCache
+from .http import get_with_retries, make_client
+from .throttle import HostThrottle
+from .. import metrics
 
 log = logging.getLogger(__name__)
 
-def collect_from_active(facility: Facility, tz: ZoneInfo) -> List[Dict[str, Any]]:
-    """
-    Parse server-rendered Active Communities "Activity Search" results for volleyball.
-    Structure may change; use resilient lookups.
-    """
-    if not facility.active_search_url:
-        return []
-    headers = { "User-Agent": settings.app.user_agent }
-    resp = requests.get(facility.active_search_url, headers=headers, timeout=settings.app.request_timeout_seconds)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "lxml")
+CARD_TAGS = frozenset({"div", "li", "section"})
+HEADING_TAGS = ("h2", "h3", "h4")
+SKIP_TAGS = frozenset({"script", "style", "noscript"})
 
-    rows = []
-    for card in soup.select("div,li,section"):
-        text = card.get_text(" ", strip=True).lower()
-        if "volleyball" not in text:
-            continue
+_TIME_RE = re.compile(r"\d{1,2}(?::\d{2})?\s*[ap]\.?m\b", re.IGNORECASE)
+_DATE_RE = re.compile(r"(Mon|Tue|Wed|Thu|Fri|Sat|Sun)[,\s]+([A-Za-z]{3})\s+(\d{1,2}),\s*(\d{4})")
 
-        program_name = "Volleyball Drop-in"
-        heading = card.find(["h2","h3","h4"])
-        if heading and "volleyball" in heading.get_text(strip=True).lower():
-            program_name = heading.get_text(strip=True)
+# bits gathered bottom-up per element
+_VB, _TIME, _DATE, _CARD_BELOW = 1, 2, 4, 8
 
-        time_text = None
-        age_text = None
-        fee_text = None
-        reserve_required = "register" in text or "reserve" in text
+def _text_bits(s: Optional[str]) -> int:
+    if not s:
+        return 0
+    bits = 0
+    if "volleyball" in s.lower():
+        bits |= _VB
+    if _TIME_RE.search(s):
+        bits |= _TIME
+    if _DATE_RE.search(s):
+        bits |= _DATE
+    return bits
 
-        frag = card.find(string=lambda s: isinstance(s, str) and ("am" in s.lower() or "pm" in s.lower()))
-        if frag:
-            time_text = frag.strip()
+def find_cards(root: etree._Element) -> List[etree._Element]:
+    """
+    Innermost div/li/section elements that carry a whole session (volleyball +
+    a time + a date). One post-order pass: each text node is scanned once and
+    its bits are folded into the parent, so nested wrappers cost nothing and
+    an outer container never re-emits a card found inside it.
+    """
+    bits: Dict[etree._Element, int] = {}
+    cards: List[etree._Element] = []
+    # reversed pre-order visits every descendant before its ancestors
+    for el in reversed(list(root.iter())):
+        tag = el.tag if isinstance(el.tag, str) else None  # comments/PIs: only their tail counts
+        b = bits.pop(el, 0)
+        if tag is not None and tag not in SKIP_TAGS:
+            b |= _text_bits(el.text)
+            if tag == "time":
+                b |= _DATE
+        if tag in CARD_TAGS and not b & _CARD_BELOW and b & (_VB | _TIME | _DATE) == (_VB | _TIME | _DATE):
+            cards.append(el)
+            b |= _CARD_BELOW
+        parent = el.getparent()
+        if parent is not None:
+            bits[parent] = bits.get(parent, 0) | b | _text_bits(el.tail)
+    cards.reverse()  # document order
+    return cards
 
-        aget = card.find(string=lambda s: isinstance(s, str) and ("ages" in s.lower() or "+" in s))
-        if aget:
-            age_text = aget.strip()
+def _card_date(card: etree._Element, text: str) -> Optional[date]:
+    for t in card.iter("time"):
+        try:
+            return dateparser.parse(t.get("datetime") or t.text_content().strip()).date()
+        except (ValueError, OverflowError):
+            break
+    m = _DATE_RE.search(text)
+    if m:
+        try:
+            return datetime.strptime(f"{m.group(2)} {m.group(3)} {m.group(4)}", "%b %d %Y").date()
+        except ValueError:
+            return dateparser.parse(m.group(0)).date()
+    return None
 
-        feet = card.find(string=lambda s: isinstance(s, str) and ("$" in s))
-        if feet:
-            fee_text = feet.strip()
+def parse_active_html(
+    html: str, facility: Facility, tz: ZoneInfo, timings: Optional[Dict[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """`timings`, if given, accumulates seconds spent in normalize_record."""
+    if not html or not html.strip():
+        return []
+    root = lxml.html.document_fromstring(html)
 
-        day_date = None
-        dates = card.find_all("time")
-        if dates:
-            try:
-                from dateutil import parser as dateparser
-                day_date = dateparser.parse(dates[0].get("datetime") or dates[0].get_text(strip=True)).date()
-            except Exception:
-                day_date = None
+    rows = []
+    for card in find_cards(root):
+        strings = [t.strip() for t in card.itertext() if t.strip()]
+        text = " ".join(strings)
+        lower = text.lower()
 
-        if day_date is None:
-            import re
-            try:
-                from dateutil import parser as dateparser
-                m = re.search(r"(Mon|Tue|Wed|Thu|Fri|Sat|Sun)[,\s]+([A-Za-z]{3})\s+(\d{1,2}),\s*(\d{4})", card.get_text(" ", strip=True))
-                if m:
-                    day_date = dateparser.parse(m.group(0)).date()
-            except Exception:
-                day_date = None
+        program_name = "Volleyball Drop-in"
+        heading = next(card.iter(*HEADING_TAGS), None)
+        if heading is not None:
+            htext = heading.text_content().strip()
+            if "volleyball" in htext.lower():
+                program_name = htext
+
+        time_text = next((t for t in strings if _TIME_RE.search(t)), None)
+        age_text = next((t for t in strings if "ages" in t.lower() or "+" in t), None)
+        fee_text = next((t for t in strings if "$" in t), None)
+        reserve_required = "register" in lower or "reserve" in lower
+        day_date = _card_date(card, text)
 
         if not (time_text and day_date):
             continue
+        t0 = time.perf_counter()
+        try:
+            rows.append(normalize_record(
+                facility=facility,
+                program_name=program_name,
+                age_text=age_text,
+                day_date=day_date,
+                time_text=time_text,
+                fee_text=fee_text,
+                reserve_required=reserve_required,
+                source_url=facility.active_search_url,
+                tz=tz
+            ))
+        except (ValueError, OverflowError):
+            log.debug("unparseable card for %s: %r", facility.facility_name, text[:200])
+        if timings is not None:
+            timings["normalize"] = timings.get("normalize", 0.0) + time.perf_counter() - t0
+    return rows
 
-        rows.append(normalize_record(
-            facility=facility,
-            program_name=program_name,
-            age_text=age_text,
-            day_date=day_date,
-            time_text=time_text,
-            fee_text=fee_text,
-            reserve_required=reserve_required,
-            source_url=facility.active_search_url,
-            tz=tz
-        ))
+def _parse_job(body: bytes, encoding: str, fields: Tuple[str, str, str, str], url: str,
+               tz_name: str) -> Tuple[list, float, float]:
+    # runs in a parse_pool worker: bytes in, row tuples and (parse, normalize) seconds out
+    facility = Facility(*fields, active_search_url=url)
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    rows = parse_active_html(body.decode(encoding, errors="replace"), facility, ZoneInfo(tz_name), timings)
+    normalize_seconds = timings.get("normalize", 0.0)
+    return [row_tuple(r) for r in rows], time.perf_counter() - t0 - normalize_seconds, normalize_seconds
+
+async def collect_from_active_async(
+    facility: Facility,
+    tz: ZoneInfo,
+    client: httpx.AsyncClient,
+    throttle: HostThrottle,
+    cache: FetchCache | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Parse server-rendered Active Communities "Activity Search" results for volleyball.
+    Structure may change; use resilient lookups.
+    With a cache, unchanged pages (304 / same body hash) return [] without parsing.
+    """
+    if not facility.active_search_url:
+        return []
+    url = facility.active_search_url
+    headers = cache.conditional_headers(facility.facility_id, url) if cache else None
+    try:
+        with metrics.timed("active", "fetch"):
+            resp = await get_with_retries(client, url, throttle, headers)
+        if resp.status_code != 304:  # httpx treats 3xx as errors too
+            resp.raise_for_status()
+    except Exception:
+        metrics.PAGES.labels("active", "failed").inc()
+        raise
+    if cache and cache.is_unchanged(facility.facility_id, url, resp.status_code, resp.content):
+        log.info("Active search unchanged for %s", facility.facility_name)
+        metrics.PAGES.labels("active", "unchanged").inc()
+        return []
+    tuples, parse_seconds, normalize_seconds = await parse_pool.run(
+        _parse_job, resp.content, resp.encoding or "utf-8", facility_fields(facility), url, tz.key)
+    rows = rows_from_tuples(facility, url, tuples, tz)
+    metrics.observe("active", "parse", parse_seconds)
+    metrics.observe("active", "normalize", normalize_seconds)
+    metrics.PAGES.labels("active", "parsed").inc()
     log.info("Active search parsed %d entries for %s", len(rows), facility.facility_name)
+    if cache:
+        cache.store(facility.facility_id, url, resp.content, resp.headers)
     return rows
+
+def collect_from_active(facility: Facility, tz: ZoneInfo, cache: FetchCache | None = None) -> List[Dict[str, Any]]:
+    """Sync one-off wrapper (shell/debugging); refresh uses the async version."""
+    async def go():
+        async with make_client() as client:
+            return await collect_from_active_async(facility, tz, client, HostThrottle(), cache)
+    return asyncio.run(go())
@@ -1,21 +1,36 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from zoneinfo import ZoneInfo
 from datetime import datetime, date
-import logging
-from ..parsers import parse_age_range, parse_time_range, iso_weekday_name
+import logging, re
+from ..facilities import Facility  # noqa: F401  (one definition, shared with refresh)
+from ..parsers import parse_age_range, parse_time_range
 
 log = logging.getLogger(__name__)
 
-@dataclass
-class Facility:
-    facility_id: str
-    facility_name: str
-    district: str
-    address: str
-    active_search_url: Optional[str] = None
-    dropin_page_url: Optional[str] = None
+_FEE_RE = re.compile(r"(\d+(?:\.\d{2})?)")
+
+# what a parse worker sends back per row; the facility columns and
+# last_seen are the same for every row of a page, so they are added here
+ROW_FIELDS = ("program_name", "age_min", "age_max", "weekday",
+              "start_datetime", "end_datetime", "fee_cad", "reserve_required")
+
+def facility_fields(facility: Facility) -> Tuple[str, str, str, str]:
+    return (facility.facility_id, facility.facility_name, facility.district, facility.address)
+
+def row_tuple(record: Dict[str, Any]) -> Tuple:
+    return tuple(record[k] for k in ROW_FIELDS)
+
+def rows_from_tuples(facility: Facility, source_url: str, tuples: List[Tuple], tz: ZoneInfo) -> List[Dict[str, Any]]:
+    base = {
+        "facility_id": facility.facility_id,
+        "facility_name": facility.facility_name,
+        "address": facility.address,
+        "district": facility.district,
+        "source_url": source_url,
+        "last_seen": datetime.now(tz),
+    }
+    return [dict(base, **dict(zip(ROW_FIELDS, t))) for t in tuples]
 
 def normalize_record(
     facility: Facility,
@@ -30,11 +45,10 @@ def normalize_record(
 ) -> Dict[str, Any]:
     age_min, age_max = parse_age_range(age_text or "")
     start_dt, end_dt = parse_time_range(time_text, day_date, tz)
-    weekday = iso_weekday_name(day_date)
+    weekday = day_date.weekday()  # 0=Mon, matches dropins.weekday INT
     fee_cad = None
     if fee_text:
-        import re
-        m = re.search(r"(\d+(?:\.\d{2})?)", fee_text)
+        m = _FEE_RE.search(fee_text)
         if m:
             fee_cad = float(m.group(1))
     now = datetime.now(tz)
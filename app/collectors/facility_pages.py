@@ -1,71 +1,308 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-import logging, random, asyncio, re
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+from typing import List, Dict, Any, Tuple
+import logging, asyncio, re, time
+from urllib.parse import urlsplit
+import httpx
+from playwright.async_api import async_playwright, Browser, Page, Route
+import lxml.html
 from zoneinfo import ZoneInfo
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 from ..settings import settings
-from .common import Facility, normalize_record
+from .common import Facility, facility_fields, normalize_record, row_tuple, rows_from_tuples
+from . import parse_pool
+from .throttle import HostThrottle
+from .fetch_cache import FetchCache
+from .fetch_strategy import BROWSER, HTTP, FetchStrategies, has_schedule_markers
+from .http import get_with_retries
 from ..parsers import parse_week_header
+from .. import metrics
 
 log = logging.getLogger(__name__)
 
-async def _fetch_html(url: str) -> str:
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page(user_agent=settings.app.user_agent)
-        await page.goto(url, wait_until="networkidle", timeout=settings.app.request_timeout_seconds * 1000)
-        html = await page.content()
-        await asyncio.sleep(random.uniform(settings.app.polite_delay_seconds_min, settings.app.polite_delay_seconds_max))
-        await browser.close()
-        return html
-
-async def collect_from_dropin_page_async(facility: Facility, tz: ZoneInfo) -> List[Dict[str, Any]]:
-    if not facility.dropin_page_url:
-        return []
-    html = await _fetch_html(facility.dropin_page_url)
-    soup = BeautifulSoup(html, "lxml")
-
-    week_ref_date = None
-    header = soup.find(string=lambda s: isinstance(s, str) and "week of" in s.lower())
-    if header:
-        week_ref_date = parse_week_header(header)
-    if week_ref_date is None:
-        from datetime import datetime
-        now = datetime.now(tz).date()
-        while now.weekday() != 0:
-            now = now - timedelta(days=1)
-        week_ref_date = now
+def _should_block(resource_type: str, url: str) -> bool:
+    # "light" profile: we only ever read the DOM, never pixels or analytics
+    if resource_type in settings.app.browser_blocked_resources:
+        return True
+    host = urlsplit(url).hostname or ""
+    return any(host == h or host.endswith("." + h) for h in settings.app.browser_blocked_hosts)
+
+async def _route(route: Route) -> None:
+    req = route.request
+    if _should_block(req.resource_type, req.url):
+        metrics.BLOCKED.labels("facility_page", req.resource_type).inc()
+        await route.abort()
+    else:
+        await route.continue_()
+
+class BrowserPool:
+    """
+    One Chromium process shared by a whole refresh, launched on the first
+    fetch (a run whose pages all read fine over HTTP never starts it). Pages
+    (each in its own context) are created lazily up to `size` and reused
+    across facilities; the semaphore bounds how many are in flight at once.
+    """
+
+    def __init__(self, size: int | None = None, throttle: HostThrottle | None = None):
+        self.size = max(1, size or settings.app.browser_pool_size)
+        self.throttle = throttle or HostThrottle()
+        self._sem = asyncio.Semaphore(self.size)
+        self._idle: List[Page] = []
+        self._pw = None
+        self._browser: Browser | None = None
+        self._bytes: Dict[Page, int] = {}  # content-length seen per page for its current load
+        self._launch_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "BrowserPool":
+        return self
+
+    async def _launch(self) -> None:
+        async with self._launch_lock:
+            if self._browser is not None:
+                return
+            with metrics.timed("facility_page", "browser_launch"):
+                pw = await async_playwright().start()
+                try:
+                    self._browser = await pw.chromium.launch(headless=True)
+                except Exception:
+                    await pw.stop()
+                    raise
+                self._pw = pw
+
+    async def __aexit__(self, *exc) -> None:
+        for page in self._idle:
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+        self._idle.clear()
+        if self._browser is not None:
+            await self._browser.close()
+        if self._pw is not None:
+            await self._pw.stop()
+
+    async def _new_page(self) -> Page:
+        await self._launch()
+        ctx = await self._browser.new_context(user_agent=settings.app.user_agent)
+        if settings.app.browser_load_profile == "light":
+            await ctx.route("**/*", _route)
+        page = await ctx.new_page()
+        page.on("response", lambda r: self._count_bytes(page, r))
+        return page
+
+    def _count_bytes(self, page: Page, response) -> None:
+        # headers only (reading bodies would cost more than it measures); chunked responses count as 0
+        try:
+            self._bytes[page] = self._bytes.get(page, 0) + int(response.headers.get("content-length") or 0)
+        except (ValueError, AttributeError):
+            pass
+
+    async def _load(self, page: Page, url: str, selector: str | None) -> str:
+        timeout = settings.app.request_timeout_seconds * 1000
+        selector = selector or settings.app.dropin_page_selector
+        if settings.app.browser_load_profile != "light" or not selector:
+            # no schedule container to wait for (a generic one like <main> is there
+            # before any script runs): let the page finish rendering instead
+            await page.goto(url, wait_until="networkidle", timeout=timeout)
+            return await page.content()
+        await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+        try:
+            await page.wait_for_selector(selector, state="attached",
+                                         timeout=settings.app.browser_selector_timeout_seconds * 1000)
+        except Exception:
+            # a stale selector shouldn't cost the page; parse whatever rendered
+            log.warning("selector %r never appeared on %s", selector, url)
+        return await page.content()
+
+    async def fetch(self, url: str, selector: str | None = None) -> str:
+        # polite delay is per host and taken before grabbing a page slot
+        await self.throttle.wait(url)
+        async with self._sem:
+            page = self._idle.pop() if self._idle else await self._new_page()
+            self._bytes[page] = 0
+            t0 = time.perf_counter()
+            try:
+                html = await self._load(page, url, selector)
+                metrics.observe("facility_page", "load", time.perf_counter() - t0)
+                metrics.PAGE_BYTES.labels("facility_page").observe(self._bytes.pop(page) or len(html.encode("utf-8")))
+            except Exception:
+                self._bytes.pop(page, None)
+                # don't hand a possibly wedged page to the next facility
+                try:
+                    await page.context.close()
+                except Exception:
+                    pass
+                raise
+            self._idle.append(page)
+            return html
+
+async def _fetch_html(url: str, pool: BrowserPool | None = None, selector: str | None = None) -> str:
+    if pool is not None:
+        return await pool.fetch(url, selector)
+    async with BrowserPool(size=1) as own:
+        return await own.fetch(url, selector)
+
+HEADING_TAGS = frozenset({"h2", "h3", "h4"})
+SKIP_TAGS = frozenset({"script", "style", "noscript"})
+_DAY_RE = re.compile(r"(mon|tues|wednes|thurs|fri|satur|sun)day", re.IGNORECASE)
+_DAY_INDEX = {"mon": 0, "tues": 1, "wednes": 2, "thurs": 3, "fri": 4, "satur": 5, "sun": 6}
+_SESSION_TIME_RE = re.compile(r"(\d{1,2}:?\d{0,2}\s*(?:AM|PM|am|pm)\s*[-–—to]+\s*\d{1,2}:?\d{0,2}\s*(?:AM|PM|am|pm))")
+_SESSION_AGE_RE = re.compile(r"(\d+\s*\+|\d+\s*[–-]\s*\d+|All ages|all ages|Adults.*\d+)")
+_SESSION_FEE_RE = re.compile(r"\$\s*\d+(?:\.\d{2})?")
+_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+def _week_in(s: str | None) -> date | None:
+    return parse_week_header(s) if s and "week of" in s.lower() else None
+
+def walk_day_sections(root) -> Tuple[List[Tuple[date | None, int, str]], date | None]:
+    """
+    One document-order pass over the page. A day heading (h2-h4 naming a
+    weekday) opens a section for its following siblings, up to the next
+    sibling heading; each "week of" text moves the reference week, so a page
+    listing several weeks yields every one of them. Returns (week, weekday,
+    text) for every volleyball entry (week is None before the first header)
+    and the first week header seen, for those.
+    """
+    entries: List[Tuple[date | None, int, str]] = []
+    open_sections: Dict[Any, Tuple[date | None, int] | None] = {}  # parent -> (week, weekday)
+    week = first_week = None
+    for el in root.iter():
+        tag = el.tag if isinstance(el.tag, str) else None
+        if tag in SKIP_TAGS:
+            continue
+        for s in (el.text, el.tail):
+            w = _week_in(s)
+            if w is not None:
+                week = w
+                first_week = first_week or w
+        parent = el.getparent()
+        if tag in HEADING_TAGS:
+            m = _DAY_RE.search(el.text_content())
+            open_sections[parent] = (week, _DAY_INDEX[m.group(1).lower()]) if m else None
+            continue
+        section = open_sections.get(parent)
+        if section is None or tag is None:
+            continue
+        text = " ".join(t.strip() for t in el.itertext() if t.strip())
+        if "volleyball" in text.lower():
+            entries.append((section[0], section[1], text))
+    return entries, first_week
+
+def current_week(tz: ZoneInfo) -> date:
+    today = datetime.now(tz).date()
+    return today - timedelta(days=today.weekday())
+
+def parse_dropin_html(
+    body: bytes, facility: Facility, tz: ZoneInfo, timings: Dict[str, float] | None = None
+) -> List[Dict[str, Any]]:
+    """`timings`, if given, accumulates seconds spent in normalize_record."""
+    return _parse_dropin(body, facility, tz, timings)[0]
+
+def _parse_dropin(
+    body: bytes, facility: Facility, tz: ZoneInfo, timings: Dict[str, float] | None = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    # second value: the page had no week header, so rows are dated from current_week()
+    if not body or not body.strip():
+        return [], False
+    entries, first_week = walk_day_sections(lxml.html.document_fromstring(body, parser=_PARSER))
+    undated = first_week is None
+    if undated:
+        first_week = current_week(tz)
 
     items: List[Dict[str, Any]] = []
-    day_names = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-    for i, day_label in enumerate(day_names):
-        for heading in soup.find_all(lambda tag: tag.name in ["h2","h3","h4"] and day_label.lower() in tag.get_text(strip=True).lower()):
-            day_date = week_ref_date + timedelta(days=i)
-            sib = heading.find_next_sibling()
-            while sib and sib.name not in ["h2","h3","h4"]:
-                text = sib.get_text(" ", strip=True)
-                if "volleyball" in text.lower():
-                    m = re.search(r"(\d{1,2}:?\d{0,2}\s*(?:AM|PM|am|pm)\s*[-–—to]+\s*\d{1,2}:?\d{0,2}\s*(?:AM|PM|am|pm))", text)
-                    timefrag = m.group(1) if m else None
-                    m2 = re.search(r"(\d+\s*\+|\d+\s*[–-]\s*\d+|All ages|all ages|Adults.*\d+)", text)
-                    age_text = m2.group(1) if m2 else None
-                    m3 = re.search(r"\$\s*\d+(?:\.\d{2})?", text)
-                    fee_text = m3.group(0) if m3 else None
-                    reserve_required = "reserve" in text.lower() or "register" in text.lower()
-                    if timefrag:
-                        items.append(normalize_record(
-                            facility=facility,
-                            program_name="Volleyball Drop-in",
-                            age_text=age_text,
-                            day_date=day_date,
-                            time_text=timefrag,
-                            fee_text=fee_text,
-                            reserve_required=reserve_required,
-                            source_url=facility.dropin_page_url,
-                            tz=tz
-                        ))
-                sib = sib.find_next_sibling()
+    for week, weekday, text in entries:
+        m = _SESSION_TIME_RE.search(text)
+        if not m:
+            continue
+        m2 = _SESSION_AGE_RE.search(text)
+        m3 = _SESSION_FEE_RE.search(text)
+        lower = text.lower()
+        t0 = time.perf_counter()
+        items.append(normalize_record(
+            facility=facility,
+            program_name="Volleyball Drop-in",
+            age_text=m2.group(1) if m2 else None,
+            day_date=(week or first_week) + timedelta(days=weekday),
+            time_text=m.group(1),
+            fee_text=m3.group(0) if m3 else None,
+            reserve_required="reserve" in lower or "register" in lower,
+            source_url=facility.dropin_page_url,
+            tz=tz
+        ))
+        if timings is not None:
+            timings["normalize"] = timings.get("normalize", 0.0) + time.perf_counter() - t0
+    return items, undated
+
+def _parse_job(body: bytes, fields: Tuple[str, str, str, str], url: str, tz_name: str) -> Tuple[list, float, float, bool]:
+    # runs in a parse_pool worker: bytes in, row tuples, (parse, normalize) seconds and the undated flag out
+    facility = Facility(*fields, dropin_page_url=url)
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    rows, undated = _parse_dropin(body, facility, ZoneInfo(tz_name), timings)
+    normalize_seconds = timings.get("normalize", 0.0)
+    return [row_tuple(r) for r in rows], time.perf_counter() - t0 - normalize_seconds, normalize_seconds, undated
+
+async def collect_from_dropin_page_async(
+    facility: Facility,
+    tz: ZoneInfo,
+    pool: BrowserPool | None = None,
+    cache: FetchCache | None = None,
+    client: httpx.AsyncClient | None = None,
+    strategies: FetchStrategies | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    With a `client`, the page is first fetched over plain HTTP and only
+    rendered in the browser when the response lacks the schedule markers
+    (or `strategies` remembers that it always does).
+    """
+    if not facility.dropin_page_url:
+        return []
+    url = facility.dropin_page_url
+    strategies = strategies or FetchStrategies()
+    # pages without a week header are dated from the current week, so a hit only holds within it
+    week = current_week(tz).isoformat()
+    html, headers, probed = None, None, False
+    try:
+        with metrics.timed("facility_page", "fetch"):
+            if client is not None and strategies.try_http(url):
+                probed = True
+                throttle = pool.throttle if pool is not None else HostThrottle()
+                cond = cache.conditional_headers(facility.facility_id, url, week) if cache else None
+                try:
+                    resp = await get_with_retries(client, url, throttle, cond)
+                    if resp.status_code == 304:
+                        if cache and cache.is_unchanged(facility.facility_id, url, 304, week=week):
+                            strategies.record(url, HTTP, probed=False)
+                            metrics.FETCH_TIER.labels("facility_page", HTTP).inc()
+                            metrics.PAGES.labels("facility_page", "unchanged").inc()
+                            return []
+                        # nothing current to be unchanged from: get the body, not the browser
+                        resp = await get_with_retries(client, url, throttle)
+                except httpx.HTTPError as e:
+                    # some hosts reset plain clients outright: exactly the pages that need the browser
+                    log.warning("HTTP probe of %s failed (%s); rendering it instead", url, e)
+                    resp = None
+                if resp is not None and resp.status_code == 200 and has_schedule_markers(resp.text):
+                    html, headers = resp.text, resp.headers
+            tier = HTTP if html is not None else BROWSER
+            if html is None:
+                html = await _fetch_html(url, pool, facility.dropin_selector)
+    except Exception:
+        metrics.PAGES.labels("facility_page", "failed").inc()
+        raise
+    strategies.record(url, tier, probed)
+    metrics.FETCH_TIER.labels("facility_page", tier).inc()
+    # rendered pages have no validators; the body hash is the change signal
+    if cache and cache.is_unchanged(facility.facility_id, url, 200, html, week):
+        log.info("Facility page unchanged for %s", facility.facility_name)
+        metrics.PAGES.labels("facility_page", "unchanged").inc()
+        return []
+    tuples, parse_seconds, normalize_seconds, undated = await parse_pool.run(
+        _parse_job, html.encode("utf-8"), facility_fields(facility), url, tz.key)
+    items = rows_from_tuples(facility, url, tuples, tz)
+    metrics.observe("facility_page", "parse", parse_seconds)
+    metrics.observe("facility_page", "normalize", normalize_seconds)
+    metrics.PAGES.labels("facility_page", "parsed").inc()
     log.info("Facility page parsed %d entries for %s", len(items), facility.facility_name)
+    if cache:
+        cache.store(facility.facility_id, url, html, headers, week if undated else None)
     return items
@@ -0,0 +1,97 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional, Set, Tuple
+from pathlib import Path
+import hashlib, json, logging, os
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+
+def content_hash(body: bytes | str) -> str:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+class FetchCache:
+    """
+    Disk-backed validators for collector fetches: ETag, Last-Modified and a
+    sha256 of the body, per (facility, url). Entries are only written after a
+    successful parse, so a page that failed to parse is retried next run.
+    A hit (304 or same hash) means the collector can skip parsing entirely;
+    the facility is then listed in `unchanged` so refresh can bump last_seen.
+    A page whose rows are dated from the week it was parsed in (no week
+    header of its own) is stored with that `week`, and stops being a hit
+    once the current week moves on.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = Path(path or settings.paths.fetch_cache_file)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                log.warning("fetch cache at %s unreadable; starting cold", self.path)
+        self.hits = 0
+        self.misses = 0
+        self.unchanged: Set[Tuple[str, str]] = set()
+
+    @staticmethod
+    def _key(facility_id: str, url: str) -> str:
+        # several facilities can share one search URL but parse different rows
+        return f"{facility_id} {url}"
+
+    def _entry(self, facility_id: str, url: str, week: str | None) -> Optional[Dict[str, Any]]:
+        e = self._entries.get(self._key(facility_id, url))
+        # an undated page's entry only vouches for the week it was parsed in
+        return e if e is not None and e.get("week") in (None, week) else None
+
+    def conditional_headers(self, facility_id: str, url: str, week: str | None = None) -> Dict[str, str]:
+        # no validators for a stale entry: a 304 would confirm bytes we have to parse again anyway
+        e = self._entry(facility_id, url, week) or {}
+        headers = {}
+        if e.get("etag"):
+            headers["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            headers["If-Modified-Since"] = e["last_modified"]
+        return headers
+
+    def is_unchanged(self, facility_id: str, url: str, status: int, body: bytes | str | None = None,
+                     week: str | None = None) -> bool:
+        """Record a hit/miss for this fetch; True means skip parsing."""
+        e = self._entry(facility_id, url, week)
+        hit = e is not None and (status == 304 or (body is not None and e.get("sha256") == content_hash(body)))
+        if not hit and status == 304:
+            return False  # the caller re-fetches the body; that fetch is the one counted
+        if hit:
+            self.hits += 1
+            self.unchanged.add((facility_id, url))
+        else:
+            self.misses += 1
+        return hit
+
+    def store(self, facility_id: str, url: str, body: bytes | str, headers: Optional[Any] = None,
+              week: str | None = None) -> None:
+        headers = headers or {}
+        self._entries[self._key(facility_id, url)] = {
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "sha256": content_hash(body),
+            "week": week,
+        }
+
+    def facility_hash(self, facility_id: str) -> Optional[str]:
+        """One digest over every cached page of a facility; None if none cached."""
+        prefix = f"{facility_id} "
+        hashes = sorted(e["sha256"] for k, e in self._entries.items() if k.startswith(prefix))
+        return content_hash("\n".join(hashes)) if hashes else None
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self._entries), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta, timezone
+import logging, re
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from ..db import as_datetime
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+HTTP, BROWSER = "http", "browser"
+
+_WEEK_RE = re.compile(r"week\s+of", re.IGNORECASE)
+_DAY_HEADING_RE = re.compile(
+    r"<h[2-4][^>]*>[^<]*(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)", re.IGNORECASE)
+
+_UPSERT_SQL = """
+INSERT INTO fetch_strategy (url, strategy, decided_at) VALUES (:url, :strategy, :decided_at)
+ON CONFLICT (url) DO UPDATE SET strategy = excluded.strategy, decided_at = excluded.decided_at
+"""
+
+
+def has_schedule_markers(html: str) -> bool:
+    """Server-rendered schedule: a "week of" header and at least one day heading."""
+    return bool(_WEEK_RE.search(html) and _DAY_HEADING_RE.search(html))
+
+
+class FetchStrategies:
+    """
+    Per-URL memory of whether a facility page is readable over plain HTTP or
+    needs the browser. Loaded once per refresh and written back with save().
+    Unknown URLs and "http" ones are tried over HTTP first; "browser" ones
+    skip straight to Chromium until `fetch_reprobe_hours` have passed, then
+    get one HTTP probe in case the page went server-rendered.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, now: Optional[datetime] = None):
+        self.engine = engine
+        self.now = now or datetime.now(timezone.utc)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Dict[str, str] = {}
+        self.counts = {HTTP: 0, BROWSER: 0}
+        if engine is not None:
+            with engine.begin() as c:
+                for url, strategy, decided_at in c.execute(text("SELECT url, strategy, decided_at FROM fetch_strategy")):
+                    self._entries[url] = {"strategy": strategy, "decided_at": as_datetime(decided_at)}
+
+    def try_http(self, url: str) -> bool:
+        e = self._entries.get(url)
+        if e is None or e["strategy"] == HTTP:
+            return True
+        return self.now - e["decided_at"] >= timedelta(hours=settings.app.fetch_reprobe_hours)
+
+    def record(self, url: str, strategy: str, probed: bool = True) -> None:
+        """Count a page fetched with `strategy`; `probed` means an HTTP probe just decided it."""
+        self.counts[strategy] += 1
+        e = self._entries.get(url)
+        if probed and (e is None or e["strategy"] != strategy or strategy == BROWSER):
+            if e is not None and e["strategy"] != strategy:
+                log.info("%s now fetched via %s", url, strategy)
+            self._entries[url] = {"strategy": strategy, "decided_at": self.now}
+            self._dirty[url] = strategy
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def save(self) -> None:
+        if self.engine is None or not self._dirty:
+            return
+        params = [{"url": u, "strategy": s, "decided_at": self.now} for u, s in self._dirty.items()]
+        with self.engine.begin() as c:
+            c.execute(text(_UPSERT_SQL), params)
+        self._dirty.clear()
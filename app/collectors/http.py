@@ -0,0 +1,59 @@
+from __future__ import annotations
+from typing import Dict, Optional
+import asyncio, importlib.util, logging, random
+import httpx
+from ..settings import settings
+from .throttle import HostThrottle
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def make_client() -> httpx.AsyncClient:
+    """One pooled keep-alive client per refresh; HTTP/2 when `h2` is installed."""
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        headers={"User-Agent": settings.app.user_agent},
+        timeout=settings.app.request_timeout_seconds,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=settings.app.http_max_connections,
+            max_keepalive_connections=settings.app.http_max_connections,
+        ),
+    )
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    value = resp.headers.get("retry-after", "")
+    return float(value) if value.isdigit() else None
+
+
+async def get_with_retries(
+    client: httpx.AsyncClient,
+    url: str,
+    throttle: HostThrottle,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Response:
+    """
+    GET through the per-host throttle, retrying transport errors, 429 and
+    5xx with exponential backoff (honouring a numeric Retry-After).
+    Other statuses, including 304, are returned as-is.
+    """
+    retries = settings.app.http_retries
+    for attempt in range(retries + 1):
+        await throttle.wait(url)
+        try:
+            resp = await client.get(url, headers=headers)
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            delay = settings.app.http_backoff_seconds * 2 ** attempt
+            log.warning("GET %s failed (%s); retry %d in %.1fs", url, e, attempt + 1, delay)
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                return resp
+            delay = _retry_after(resp) or settings.app.http_backoff_seconds * 2 ** attempt
+            log.warning("GET %s -> %d; retry %d in %.1fs", url, resp.status_code, attempt + 1, delay)
+        await asyncio.sleep(delay + random.uniform(0, settings.app.http_backoff_seconds))
+    raise AssertionError("unreachable")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+import asyncio, logging, multiprocessing, os
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+# HTML parsing and normalization are CPU-bound; done on the event loop they
+# stall every in-flight fetch and use one core. Collectors hand raw bytes to
+# a module-level job function here and get compact row tuples back, so fetch
+# concurrency and parse parallelism are sized independently. The pool is
+# started on first use and lives until shutdown(): once per refresh for cron
+# runs, once per process for app.worker, whose rounds all reuse it (spawning
+# cpu_count interpreters per small batch would cost more than the parsing).
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def workers() -> int:
+    return settings.app.parse_workers or os.cpu_count() or 1
+
+
+def _get() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent has an event loop, threads and open DB pools
+        _pool = ProcessPoolExecutor(max_workers=workers(), mp_context=multiprocessing.get_context("spawn"))
+        log.info("parse pool started with %d workers", workers())
+    return _pool
+
+
+async def run(fn: Callable[..., Any], *args: Any) -> Any:
+    """fn(*args) in a worker process; inline when parse_workers is 1."""
+    if workers() <= 1:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    pool = _get()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # a child died (OOM killer, a crash in lxml) and took the pool with it;
+        # a long-lived worker would otherwise fail every later round
+        global _pool
+        if _pool is pool:  # concurrent callers: only the first replaces it
+            log.warning("parse pool broken; starting a fresh one")
+            pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        return await loop.run_in_executor(_get(), fn, *args)
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
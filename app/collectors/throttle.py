@@ -0,0 +1,29 @@
+from __future__ import annotations
+from typing import Dict
+from urllib.parse import urlsplit
+import asyncio, random
+from ..settings import settings
+
+
+class HostThrottle:
+    """
+    Per-host politeness: requests to the same host are spaced by a random
+    delay in [polite_delay_seconds_min, polite_delay_seconds_max]; different
+    hosts never wait on each other.
+    """
+
+    def __init__(self, delay_min: float | None = None, delay_max: float | None = None):
+        self.delay_min = settings.app.polite_delay_seconds_min if delay_min is None else delay_min
+        self.delay_max = settings.app.polite_delay_seconds_max if delay_max is None else delay_max
+        self._next_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def wait(self, url: str) -> None:
+        host = urlsplit(url).netloc.lower()
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_at.get(host, 0.0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at[host] = loop.time() + random.uniform(self.delay_min, self.delay_max)
@@ -1,11 +1,78 @@
 # app/db.py
 from __future__ import annotations
 import os
-from typing import Iterable, Dict, Any
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from urllib.parse import quote
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Dict, Any, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from .settings import settings
 
 _engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+
+# SQLite keeps every timestamp as epoch seconds: range scans compare numbers
+# (not offset-bearing text, which sorts wrong across DST changes) and the
+# index stays compact. _epoch_binds converts datetime parameters on each
+# SQLite engine (never the sqlite3 module); reads come back as numbers and go
+# through as_datetime(). Postgres keeps native TIMESTAMPTZ.
+
+def _epoch(v: datetime) -> int | float:
+    if v.tzinfo is None:  # same rule as as_datetime: naive means UTC
+        v = v.replace(tzinfo=timezone.utc)
+    ts = v.timestamp()
+    return int(ts) if ts.is_integer() else ts  # whole seconds stay INTEGER
+
+def _epoch_params(params: Any) -> Any:
+    if isinstance(params, dict):
+        return {k: _epoch(v) if isinstance(v, datetime) else v for k, v in params.items()}
+    return tuple(_epoch(v) if isinstance(v, datetime) else v for v in params)
+
+def _convert_binds(conn, cursor, statement, parameters, context, executemany):
+    if executemany:
+        return statement, [_epoch_params(p) for p in parameters]
+    return statement, _epoch_params(parameters)
+
+def _epoch_binds(engine: Engine) -> None:
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "before_cursor_execute", _convert_binds):
+        event.listen(engine, "before_cursor_execute", _convert_binds, retval=True)
+
+def as_datetime(v: Any, tz: Any = timezone.utc) -> Optional[datetime]:
+    """A stored timestamp (epoch int on SQLite, datetime on Postgres) as an aware datetime in `tz`."""
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return datetime.fromtimestamp(v, tz)
+    if isinstance(v, str):  # SQLite databases written before migration 9
+        v = datetime.fromisoformat(v)
+    if v.tzinfo is None:  # CURRENT_TIMESTAMP is UTC
+        v = v.replace(tzinfo=timezone.utc)
+    return v.astimezone(tz)
+
+_TS_COLS = frozenset({"start_datetime", "end_datetime", "last_seen"})
+
+def decode_row(row: Dict[str, Any], tz: Any) -> Dict[str, Any]:
+    """A dropins row with its timestamps as local datetimes."""
+    return {k: as_datetime(v, tz) if k in _TS_COLS else v for k, v in row.items()}
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and url.split("///", 1)[-1] != ""
+
+def _sqlite_pragmas(engine: Engine, readonly: bool = False) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record) -> None:
+        cur = dbapi_conn.cursor()
+        if not readonly:
+            # WAL: readers never block the refresh writer and vice versa
+            cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        cur.execute(f"PRAGMA busy_timeout={int(settings.app.sqlite_busy_timeout_ms)}")
+        cur.execute(f"PRAGMA mmap_size={int(settings.app.sqlite_mmap_bytes)}")
+        cur.execute(f"PRAGMA cache_size=-{int(settings.app.sqlite_cache_kib)}")
+        cur.close()
 
 def _normalize(url: str) -> str:
     if url.startswith("postgres://"):
@@ -20,57 +87,401 @@ def get_engine() -> Engine:
     global _engine
     if _engine is not None:
         return _engine
+    url = _db_url()
+    _engine = create_engine(url, pool_pre_ping=True)
+    if _is_sqlite_file(url):
+        _sqlite_pragmas(_engine)
+    _init_schema(_engine)
+    return _engine
+
+def _db_url() -> str:
     raw = os.getenv("APP__DB_URL") or os.getenv("DATABASE_URL")
     if not raw:
         raise RuntimeError("APP__DB_URL not set")
-    _engine = create_engine(_normalize(raw), pool_pre_ping=True)
-    _init_schema(_engine)
-    return _engine
+    return _normalize(raw)
 
-def _init_schema(engine: Engine) -> None:
-    ddl = """
-    CREATE TABLE IF NOT EXISTS dropins (
-        id BIGSERIAL PRIMARY KEY,
-        facility_id TEXT NOT NULL,
-        facility_name TEXT NOT NULL,
-        district TEXT,
-        address TEXT,
-        program_name TEXT NOT NULL,
-        age_min INT,
-        age_max INT,
-        weekday INT,
-        start_datetime TIMESTAMPTZ NOT NULL,
-        end_datetime   TIMESTAMPTZ NOT NULL,
-        fee_cad NUMERIC,
-        reserve_required BOOLEAN,
-        source_url TEXT,
-        last_seen TIMESTAMPTZ NOT NULL,
-        CONSTRAINT uq_dropin UNIQUE (facility_id, start_datetime, program_name)
-    );
+def _async_url(url: str) -> str:
+    # psycopg 3 serves both; SQLAlchemy picks its async flavour for create_async_engine
+    if url.startswith("sqlite://") and "+aiosqlite" not in url:
+        url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if settings.app.sqlite_readonly_web and _is_sqlite_file(url) and "mode=ro" not in url:
+        # the web process only reads (jobs go through get_engine); a read-only
+        # handle can never take the write lock away from a running refresh
+        prefix, path = url.split("///", 1)
+        # a URI filename: spaces, ?, # and % in the path must be percent-encoded
+        url = f"{prefix}///file:{quote(path)}?mode=ro&uri=true"
+    return url
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Pooled async engine for the web process. open_async_engine() builds it at
+    startup; this lazy path only exists for callers that skip the lifespan.
     """
+    global _async_engine
+    if _async_engine is None:
+        url = _async_url(_db_url())
+        kw: Dict[str, Any] = {"pool_pre_ping": True}
+        if url.startswith("sqlite+aiosqlite:///:memory:"):
+            pass  # one private database per connection; pooling makes no sense
+        else:
+            if url.startswith("sqlite"):
+                kw["poolclass"] = AsyncAdaptedQueuePool  # aiosqlite defaults to NullPool
+            kw.update(
+                pool_size=settings.app.db_pool_size,
+                max_overflow=settings.app.db_max_overflow,
+                pool_timeout=settings.app.db_pool_timeout_seconds,
+                pool_recycle=settings.app.db_pool_recycle_seconds,
+            )
+        _async_engine = create_async_engine(url, **kw)
+        _epoch_binds(_async_engine.sync_engine)
+        if _is_sqlite_file(url):
+            _sqlite_pragmas(_async_engine.sync_engine, readonly="mode=ro" in url)
+    return _async_engine
+
+async def open_async_engine() -> AsyncEngine:
+    """Run migrations (sync, once), then build the async pool and pre-fill it."""
+    import asyncio
+    await asyncio.to_thread(get_engine)
+    engine = get_async_engine()
+
+    async def ping() -> None:
+        async with engine.connect() as c:
+            await c.execute(text("SELECT 1"))
+
+    # hold pool_size connections at once so each is really opened
+    await asyncio.gather(*(ping() for _ in range(settings.app.db_pool_size)))
+    return engine
+
+async def close_async_engine() -> None:
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+_COLS = (
+    "facility_id", "facility_name", "district", "address", "program_name",
+    "age_min", "age_max", "weekday", "start_datetime", "end_datetime",
+    "fee_cad", "reserve_required", "source_url", "last_seen",
+)
+
+_DROPINS_DDL = """
+CREATE TABLE IF NOT EXISTS dropins (
+    id BIGSERIAL PRIMARY KEY,
+    facility_id TEXT NOT NULL,
+    facility_name TEXT NOT NULL,
+    district TEXT,
+    address TEXT,
+    program_name TEXT NOT NULL,
+    age_min INT,
+    age_max INT,
+    weekday INT,
+    start_datetime TIMESTAMPTZ NOT NULL,
+    end_datetime   TIMESTAMPTZ NOT NULL,
+    fee_cad NUMERIC,
+    reserve_required BOOLEAN,
+    source_url TEXT,
+    last_seen TIMESTAMPTZ NOT NULL,
+    CONSTRAINT uq_dropin UNIQUE (facility_id, start_datetime, program_name)
+)
+"""
+
+# SQLite only fills an id that is exactly INTEGER PRIMARY KEY (the rowid alias);
+# BIGSERIAL there is a plain column that stays NULL
+_DROPINS_SQLITE_DDL = (
+    _DROPINS_DDL.replace("IF NOT EXISTS dropins", "dropins_rebuilt").replace("BIGSERIAL", "INTEGER")
+)
+
+# (version, statements) — applied once each, in order, and recorded in
+# schema_migrations. Never edit a shipped entry; append a new version.
+MIGRATIONS: List[Tuple[int, List[Union[str, Tuple[str, str]]]]] = [
+    (1, [_DROPINS_DDL]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS ix_dropins_start ON dropins (start_datetime)",
+        "CREATE INDEX IF NOT EXISTS ix_dropins_weekday_start ON dropins (weekday, start_datetime)",
+    ]),
+    (3, [
+        # single row; generation is bumped at the end of every refresh
+        "CREATE TABLE IF NOT EXISTS refresh_state ("
+        " id INT PRIMARY KEY, generation BIGINT NOT NULL, updated_at TIMESTAMPTZ NOT NULL)",
+        "INSERT INTO refresh_state (id, generation, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)",
+    ]),
+    (4, [
+        # background refresh jobs; `active` is 1 while queued/running and NULL
+        # afterwards, so the UNIQUE constraint allows one live job at a time
+        """
+        CREATE TABLE IF NOT EXISTS refresh_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            active INT UNIQUE,
+            created_at TIMESTAMPTZ NOT NULL,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            heartbeat_at TIMESTAMPTZ,
+            progress TEXT,
+            result TEXT,
+            error TEXT
+        )
+        """,
+    ]),
+    (5, [
+        # per-facility crawl schedule; see app.scheduler
+        """
+        CREATE TABLE IF NOT EXISTS facility_state (
+            facility_id TEXT PRIMARY KEY,
+            last_attempt TIMESTAMPTZ,
+            last_success TIMESTAMPTZ,
+            last_changed TIMESTAMPTZ,
+            last_hash TEXT,
+            failure_count INT NOT NULL DEFAULT 0,
+            next_due TIMESTAMPTZ
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_facility_state_due ON facility_state (next_due)",
+    ]),
+    (6, [
+        # cold storage for rows app.retention moves out of the hot table
+        """
+        CREATE TABLE IF NOT EXISTS dropins_archive (
+            facility_id TEXT NOT NULL,
+            facility_name TEXT NOT NULL,
+            district TEXT,
+            address TEXT,
+            program_name TEXT NOT NULL,
+            age_min INT,
+            age_max INT,
+            weekday INT,
+            start_datetime TIMESTAMPTZ NOT NULL,
+            end_datetime   TIMESTAMPTZ NOT NULL,
+            fee_cad NUMERIC,
+            reserve_required BOOLEAN,
+            source_url TEXT,
+            last_seen TIMESTAMPTZ NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL,
+            archive_reason TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_dropins_archive_start ON dropins_archive (start_datetime)",
+        "CREATE INDEX IF NOT EXISTS ix_dropins_archive_facility ON dropins_archive (facility_id, start_datetime)",
+    ]),
+    (7, [
+        # how each facility page has to be fetched; see collectors.fetch_strategy
+        """
+        CREATE TABLE IF NOT EXISTS fetch_strategy (
+            url TEXT PRIMARY KEY,
+            strategy TEXT NOT NULL,
+            decided_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+    ]),
+    (8, [
+        # the crawl list (see app.facilities) plus the lease a worker holds
+        # while crawling a facility (see app.worker)
+        """
+        CREATE TABLE IF NOT EXISTS facilities (
+            facility_id TEXT PRIMARY KEY,
+            facility_name TEXT NOT NULL,
+            district TEXT,
+            address TEXT,
+            active_search_url TEXT,
+            dropin_page_url TEXT,
+            dropin_selector TEXT,
+            updated_at TIMESTAMPTZ NOT NULL,
+            lease_owner TEXT,
+            lease_expires TIMESTAMPTZ
+        )
+        """,
+    ]),
+    (9, [
+        # SQLite: timestamps were stored as offset-bearing ISO text; make them
+        # integer epoch seconds like everything written from now on
+        ("sqlite", f"UPDATE {table} SET {col} = CAST(strftime('%s', {col}) AS INTEGER) WHERE typeof({col}) = 'text'")
+        for table, col in (
+            ("dropins", "start_datetime"), ("dropins", "end_datetime"), ("dropins", "last_seen"),
+            ("dropins_archive", "start_datetime"), ("dropins_archive", "end_datetime"),
+            ("dropins_archive", "last_seen"), ("dropins_archive", "archived_at"),
+            ("refresh_state", "updated_at"),
+            ("refresh_jobs", "created_at"), ("refresh_jobs", "started_at"),
+            ("refresh_jobs", "finished_at"), ("refresh_jobs", "heartbeat_at"),
+            ("facility_state", "last_attempt"), ("facility_state", "last_success"),
+            ("facility_state", "last_changed"), ("facility_state", "next_due"),
+            ("fetch_strategy", "decided_at"),
+            ("facilities", "updated_at"), ("facilities", "lease_expires"),
+            ("schema_migrations", "applied_at"),
+        )
+    ]),
+    (10, [
+        # SQLite: rebuild dropins so id is the rowid alias (existing rows get
+        # their rowid as id); dropping the old table takes its indexes along
+        ("sqlite", _DROPINS_SQLITE_DDL),
+        ("sqlite", f"INSERT INTO dropins_rebuilt (id, {', '.join(_COLS)}) SELECT rowid, {', '.join(_COLS)} FROM dropins"),
+        ("sqlite", "DROP TABLE dropins"),
+        ("sqlite", "ALTER TABLE dropins_rebuilt RENAME TO dropins"),
+        ("sqlite", "CREATE INDEX IF NOT EXISTS ix_dropins_start ON dropins (start_datetime)"),
+        ("sqlite", "CREATE INDEX IF NOT EXISTS ix_dropins_weekday_start ON dropins (weekday, start_datetime)"),
+    ]),
+]
+
+def _init_schema(engine: Engine) -> None:
+    # every engine the app uses comes through here first
+    _epoch_binds(engine)
     with engine.begin() as c:
-        c.execute(text(ddl))
+        if engine.dialect.name == "postgresql":
+            # serialize concurrent workers booting against the same database
+            c.execute(text("SELECT pg_advisory_xact_lock(724011)"))
+        c.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version INT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL)"
+        ))
+        done = {v for (v,) in c.execute(text("SELECT version FROM schema_migrations"))}
+        for version, stmts in MIGRATIONS:
+            if version in done:
+                continue
+            for stmt in stmts:
+                if isinstance(stmt, tuple):  # (dialect, sql): only for that backend
+                    dialect, stmt = stmt
+                    if dialect != engine.dialect.name:
+                        continue
+                c.execute(text(stmt))
+            c.execute(
+                text("INSERT INTO schema_migrations (version, applied_at) VALUES (:v, :t)"),
+                {"v": version, "t": datetime.now(timezone.utc)},
+            )
 
-def insert_or_ignore(engine: Engine, rows: Iterable[Dict[str, Any]]) -> int:
-    rows = list(rows)  # safe for generators
-    if not rows:
-        return 0
-    sql = """
-    INSERT INTO dropins (
-      facility_id, facility_name, district, address, program_name,
-      age_min, age_max, weekday, start_datetime, end_datetime,
-      fee_cad, reserve_required, source_url, last_seen
-    ) VALUES (
-      :facility_id, :facility_name, :district, :address, :program_name,
-      :age_min, :age_max, :weekday, :start_datetime, :end_datetime,
-      :fee_cad, :reserve_required, :source_url, :last_seen
+def current_generation(conn: Connection) -> Tuple[int, datetime]:
+    gen, updated_at = conn.execute(text("SELECT generation, updated_at FROM refresh_state WHERE id = 1")).one()
+    return int(gen), as_datetime(updated_at)
+
+def bump_generation(engine: Engine) -> int:
+    with engine.begin() as c:
+        c.execute(
+            text("UPDATE refresh_state SET generation = generation + 1, updated_at = :now WHERE id = 1"),
+            {"now": datetime.now(timezone.utc)},
+        )
+        return current_generation(c)[0]
+
+DAY_SQL = """
+SELECT facility_name, program_name, start_datetime, end_datetime, address, fee_cad
+FROM dropins
+WHERE start_datetime >= :day_start AND start_datetime < :next_day_start
+ORDER BY start_datetime, facility_name
+"""
+
+def day_bounds(d: date, tz: ZoneInfo) -> Tuple[datetime, datetime]:
+    """Half-open [local midnight, next local midnight) — 23h/25h on DST days."""
+    nxt = d + timedelta(days=1)
+    return (
+        datetime(d.year, d.month, d.day, tzinfo=tz),
+        datetime(nxt.year, nxt.month, nxt.day, tzinfo=tz),
+    )
+
+_KEY = ("facility_id", "start_datetime", "program_name")
+# everything but the key is refreshed on conflict
+_MUTABLE = tuple(c for c in _COLS if c not in _KEY)
+
+_STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS dropins_stage (
+    facility_id TEXT NOT NULL,
+    facility_name TEXT NOT NULL,
+    district TEXT,
+    address TEXT,
+    program_name TEXT NOT NULL,
+    age_min INT,
+    age_max INT,
+    weekday INT,
+    start_datetime TIMESTAMPTZ NOT NULL,
+    end_datetime   TIMESTAMPTZ NOT NULL,
+    fee_cad NUMERIC,
+    reserve_required BOOLEAN,
+    source_url TEXT,
+    last_seen TIMESTAMPTZ NOT NULL
+)
+"""
+
+def _stage_insert_sql(n: int) -> str:
+    values = ",\n".join(
+        "(" + ", ".join(f":{c}_{i}" for c in _COLS) + ")" for i in range(n)
     )
-    ON CONFLICT ON CONSTRAINT uq_dropin DO NOTHING
+    return f"INSERT INTO dropins_stage ({', '.join(_COLS)}) VALUES\n{values}"
+
+def _same(dialect: str) -> str:
+    return "IS" if dialect == "sqlite" else "IS NOT DISTINCT FROM"
+
+def _merge_sql(dialect: str, same_source_only: bool = False) -> str:
+    cols = ", ".join(_COLS)
+    sets = ",\n      ".join(f"{c} = excluded.{c}" for c in _MUTABLE)
+    guard = f"\n    WHERE dropins.source_url {_same(dialect)} excluded.source_url" if same_source_only else ""
+    # WHERE true: SQLite needs it to parse INSERT ... SELECT ... ON CONFLICT
+    return f"""
+    INSERT INTO dropins ({cols})
+    SELECT {cols} FROM dropins_stage WHERE true
+    ON CONFLICT ({", ".join(_KEY)}) DO UPDATE SET
+      {sets}{guard}
+    """
+
+def _count_sql(dialect: str, same_source_only: bool = False) -> str:
+    same = _same(dialect)
+    # last_seen always moves, so it doesn't count as a change
+    unchanged = " AND ".join(f"d.{c} {same} s.{c}" for c in _MUTABLE if c != "last_seen")
+    if same_source_only:  # rows owned by another source are left alone
+        unchanged = f"(({unchanged}) OR NOT (d.source_url {same} s.source_url))"
+    on = " AND ".join(f"d.{c} = s.{c}" for c in _KEY)
+    return f"""
+    SELECT
+      COUNT(*) AS total,
+      SUM(CASE WHEN d.facility_id IS NULL THEN 1 ELSE 0 END) AS inserted,
+      SUM(CASE WHEN d.facility_id IS NOT NULL AND {unchanged} THEN 1 ELSE 0 END) AS unchanged
+    FROM dropins_stage s
+    LEFT JOIN dropins d ON {on}
+    """
+
+def upsert_dropins(
+    engine: Engine, rows: Iterable[Dict[str, Any]], batch_size: int = 500, same_source_only: bool = False
+) -> Dict[str, int]:
     """
-    inserted = 0
+    Set-based upsert: rows are staged in a temp table with multi-row VALUES
+    (one round-trip per `batch_size` rows) and merged with a single
+    INSERT ... ON CONFLICT DO UPDATE. Existing rows get last_seen and any
+    changed fields refreshed. Returns inserted/updated/unchanged counts.
+    With same_source_only, a conflicting row from another source_url is kept
+    as-is (lower-priority sources fill gaps but never overwrite).
+    """
+    # last row wins for duplicate keys; Postgres refuses to update a row twice in one statement
+    uniq: Dict[tuple, Dict[str, Any]] = {}
+    for r in rows:
+        uniq[tuple(r[k] for k in _KEY)] = r
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+    if not uniq:
+        return stats
+    staged = list(uniq.values())
+    with engine.begin() as c:
+        c.execute(text(_STAGE_DDL))
+        c.execute(text("DELETE FROM dropins_stage"))
+        for i in range(0, len(staged), batch_size):
+            chunk = staged[i:i + batch_size]
+            params = {f"{col}_{j}": r.get(col) for j, r in enumerate(chunk) for col in _COLS}
+            c.execute(text(_stage_insert_sql(len(chunk))), params)
+        dialect = engine.dialect.name
+        total, inserted, unchanged = c.execute(text(_count_sql(dialect, same_source_only))).one()
+        c.execute(text(_merge_sql(dialect, same_source_only)))
+        c.execute(text("DROP TABLE dropins_stage"))
+    stats["inserted"] = int(inserted or 0)
+    stats["unchanged"] = int(unchanged or 0)
+    stats["updated"] = int(total) - stats["inserted"] - stats["unchanged"]
+    return stats
+
+def touch_last_seen(engine: Engine, sources: Iterable[Tuple[str, str]], seen: datetime) -> int:
+    """Bump last_seen for every row of (facility_id, source_url) pairs whose page didn't change."""
+    params = [{"fid": fid, "url": url, "seen": seen} for fid, url in sources]
+    if not params:
+        return 0
     with engine.begin() as c:
-        for r in rows:
-            res = c.execute(text(sql), r)
-            # rowcount is 1 for inserted, 0 for conflict (Postgres)
-            inserted += (res.rowcount or 0)
-    return inserted
+        res = c.execute(
+            text("UPDATE dropins SET last_seen = :seen WHERE facility_id = :fid AND source_url = :url"),
+            params,
+        )
+    return res.rowcount or 0
+
+def insert_or_ignore(engine: Engine, rows: Iterable[Dict[str, Any]]) -> int:
+    # kept for older callers; returns only the number of new rows
+    return upsert_dropins(engine, rows)["inserted"]
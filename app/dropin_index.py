@@ -0,0 +1,197 @@
+# app/dropin_index.py
+from __future__ import annotations
+import asyncio, base64, heapq, threading, time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .db import as_datetime
+
+# Entries are bucketed by (weekday, district) and kept sorted by the keyset
+# (start epoch, facility_id, program_name) — the dropins unique key — so
+# "Tuesday evenings downtown" touches one or two small buckets and a cursor
+# is just a bisect.
+
+SortKey = Tuple[float, str, str]
+
+UPCOMING_SQL = """
+SELECT facility_id, facility_name, district, address, program_name,
+       age_min, age_max, start_datetime, end_datetime, fee_cad,
+       reserve_required, source_url
+FROM dropins
+WHERE end_datetime >= :now
+"""
+
+
+@dataclass
+class Entry:
+    key: SortKey
+    minute: int  # local start time-of-day, minutes after midnight
+    end: float  # epoch; the index outlives its build time, so queries drop ended sessions
+    row: Dict[str, Any]
+
+    def __lt__(self, other: "Entry") -> bool:
+        return self.key < other.key
+
+
+def encode_cursor(key: SortKey) -> str:
+    raw = f"{key[0]:.0f}\x1f{key[1]}\x1f{key[2]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    epoch, facility_id, program_name = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("\x1f")
+    return (float(epoch), facility_id, program_name)
+
+
+class DropinIndex:
+    def __init__(self, rows: Iterable[Dict[str, Any]], tz: ZoneInfo, signature: Any = None):
+        self.tz = tz
+        self.signature = signature
+        self.buckets: Dict[Tuple[int, str], List[Entry]] = {}
+        for r in rows:
+            start = as_datetime(r["start_datetime"], tz)
+            end = as_datetime(r["end_datetime"], tz)
+            fee = r.get("fee_cad")
+            row = {
+                "facility_id": r["facility_id"],
+                "facility_name": r["facility_name"],
+                "district": r.get("district") or "",
+                "address": r.get("address") or "",
+                "program_name": r["program_name"],
+                "age_min": r.get("age_min"),
+                "age_max": r.get("age_max"),
+                "weekday": start.strftime("%a"),
+                "start_datetime": start.isoformat(),
+                "end_datetime": end.isoformat(),
+                "fee_cad": float(fee) if fee is not None else None,
+                "reserve_required": bool(r.get("reserve_required")),
+                "source_url": r.get("source_url"),
+            }
+            entry = Entry(
+                key=(start.timestamp(), r["facility_id"], r["program_name"]),
+                minute=start.hour * 60 + start.minute,
+                end=end.timestamp(),
+                row=row,
+            )
+            self.buckets.setdefault((start.weekday(), row["district"].lower()), []).append(entry)
+        for bucket in self.buckets.values():
+            bucket.sort()
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self.buckets.values())
+
+    def query(
+        self,
+        weekday: Optional[int] = None,
+        after_minute: Optional[int] = None,
+        before_minute: Optional[int] = None,
+        district: Optional[str] = None,
+        age: Optional[int] = None,
+        max_fee: Optional[float] = None,
+        cursor: Optional[SortKey] = None,
+        limit: int = 50,
+        now: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # built once per generation; sessions that ended since still sit in the buckets
+        now = time.time() if now is None else now
+        want = (district or "").strip().lower()
+        lists: List[Iterator[Entry]] = []
+        for (wd, dist), bucket in self.buckets.items():
+            if weekday is not None and wd != weekday:
+                continue
+            if want and want not in dist:
+                continue
+            lo = _bisect_key(bucket, cursor) if cursor is not None else 0
+            lists.append(iter(bucket[lo:]))
+
+        out: List[Dict[str, Any]] = []
+        last: Optional[SortKey] = None
+        for e in heapq.merge(*lists):
+            if e.end < now:
+                continue
+            if after_minute is not None and e.minute < after_minute:
+                continue
+            if before_minute is not None and e.minute >= before_minute:
+                continue
+            r = e.row
+            if age is not None:
+                if r["age_min"] is not None and age < r["age_min"]:
+                    continue
+                if r["age_max"] is not None and age > r["age_max"]:
+                    continue
+            # unknown fees are kept: most unlisted drop-ins are free
+            if max_fee is not None and r["fee_cad"] is not None and r["fee_cad"] > max_fee:
+                continue
+            if len(out) == limit:
+                return out, encode_cursor(last)
+            out.append(r)
+            last = e.key
+        return out, None
+
+
+    def iter_rows(
+        self,
+        weekday: Optional[int] = None,
+        district: Optional[str] = None,
+        facility_id: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Every upcoming row matching exactly, in start order (for feeds, no paging)."""
+        want = (district or "").strip().lower()
+        lists = [
+            iter(bucket) for (wd, dist), bucket in self.buckets.items()
+            if (weekday is None or wd == weekday) and (not want or dist == want)
+        ]
+        for e in heapq.merge(*lists):
+            if facility_id is None or e.row["facility_id"] == facility_id:
+                yield e.row
+
+
+def _bisect_key(bucket: List[Entry], key: SortKey) -> int:
+    # first entry strictly after `key`
+    lo, hi = 0, len(bucket)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key < bucket[mid].key:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class IndexHolder:
+    """Process-wide DropinIndex, rebuilt when the refresh generation moves (query() drops ended sessions)."""
+
+    def __init__(self, tz: ZoneInfo):
+        self.tz = tz
+        self._index: Optional[DropinIndex] = None
+        self._lock = threading.Lock()
+        self._alock: Optional[asyncio.Lock] = None  # created on the serving loop
+
+    def get(self, engine: Engine, generation: int) -> DropinIndex:
+        idx = self._index
+        if idx is not None and idx.signature == generation:
+            return idx
+        with self._lock:
+            if self._index is None or self._index.signature != generation:
+                with engine.begin() as c:
+                    rows = [dict(r._mapping) for r in c.execute(text(UPCOMING_SQL), {"now": datetime.now(self.tz)})]
+                self._index = DropinIndex(rows, self.tz, signature=generation)
+            return self._index
+
+    async def aget(self, engine: AsyncEngine, generation: int) -> DropinIndex:
+        idx = self._index
+        if idx is not None and idx.signature == generation:
+            return idx
+        if self._alock is None:
+            self._alock = asyncio.Lock()
+        async with self._alock:
+            if self._index is None or self._index.signature != generation:
+                async with engine.connect() as c:
+                    result = await c.execute(text(UPCOMING_SQL), {"now": datetime.now(self.tz)})
+                    rows = [dict(r._mapping) for r in result]
+                self._index = DropinIndex(rows, self.tz, signature=generation)
+            return self._index
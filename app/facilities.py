@@ -0,0 +1,138 @@
+# app/facilities.py
+from __future__ import annotations
+import json, logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from .db import as_datetime
+from .settings import settings
+
+# The facilities table is the crawl list every refresh process and worker
+# reads. facilities.json seeds it on first use; after that, edits to the file
+# are applied with `python -m app.facilities import [--prune]`.
+
+log = logging.getLogger(__name__)
+
+_FIELDS = ("facility_id", "facility_name", "district", "address",
+           "active_search_url", "dropin_page_url", "dropin_selector")
+
+
+@dataclass
+class Facility:
+    facility_id: str
+    facility_name: str
+    district: str = ""
+    address: str = ""
+    active_search_url: Optional[str] = None
+    dropin_page_url: Optional[str] = None
+    dropin_selector: Optional[str] = None  # overrides settings.app.dropin_page_selector
+
+
+def _resolve_path(path: str) -> Path:
+    p = Path(path)
+    if not p.is_absolute():
+        # repo root relative to app/
+        base = Path(__file__).resolve().parent.parent
+        p = (base / p).resolve()
+    return p
+
+
+def load_facilities(path: str = "facilities.json") -> List[Facility]:
+    p = _resolve_path(path)
+    data = json.loads(p.read_text(encoding="utf-8"))
+    facs: List[Facility] = []
+    for d in data:
+        facs.append(
+            Facility(
+                facility_id=d["facility_id"],
+                facility_name=d["facility_name"],
+                district=d.get("district", ""),
+                address=d.get("address", ""),
+                # be flexible with possible alt keys in your JSON:
+                active_search_url=d.get("active_search_url") or d.get("active_url") or d.get("activeSearchUrl"),
+                dropin_page_url=d.get("dropin_page_url") or d.get("dropin_url") or d.get("dropinPageUrl"),
+                dropin_selector=d.get("dropin_selector"),
+            )
+        )
+    return facs
+
+
+_UPSERT_SQL = f"""
+INSERT INTO facilities ({", ".join(_FIELDS)}, updated_at)
+VALUES ({", ".join(":" + f for f in _FIELDS)}, :updated_at)
+ON CONFLICT (facility_id) DO UPDATE SET
+    {", ".join(f"{f} = excluded.{f}" for f in _FIELDS[1:])},
+    updated_at = excluded.updated_at
+"""
+
+
+def import_facilities(engine: Engine, facilities: List[Facility], prune: bool = False) -> Dict[str, int]:
+    """Upsert `facilities`; with prune, delete rows no longer listed."""
+    now = datetime.now(timezone.utc)
+    params = [dict({f: getattr(fac, f) for f in _FIELDS}, updated_at=now) for fac in facilities]
+    removed = 0
+    with engine.begin() as c:
+        if params:
+            c.execute(text(_UPSERT_SQL), params)
+        if prune:
+            keep = {fac.facility_id for fac in facilities}
+            gone = [r[0] for r in c.execute(text("SELECT facility_id FROM facilities")) if r[0] not in keep]
+            if gone:
+                c.execute(text("DELETE FROM facilities WHERE facility_id IN :ids")
+                          .bindparams(bindparam("ids", expanding=True)), {"ids": gone})
+            removed = len(gone)
+    return {"upserted": len(params), "removed": removed}
+
+
+def db_facilities(engine: Engine, ids: Optional[List[str]] = None,
+                  unleased_at: Optional[datetime] = None) -> List[Facility]:
+    """
+    Facilities in id order; `ids` restricts to those, `unleased_at` skips
+    any a worker holds an unexpired lease on at that time.
+    """
+    sql = f"SELECT {', '.join(_FIELDS)}, lease_expires FROM facilities ORDER BY facility_id"
+    with engine.begin() as c:
+        rows = c.execute(text(sql)).all()
+    wanted = set(ids) if ids is not None else None
+    out = []
+    for r in rows:
+        d = dict(zip(_FIELDS, r[:-1]))
+        if wanted is not None and d["facility_id"] not in wanted:
+            continue
+        if unleased_at is not None and r[-1] is not None and as_datetime(r[-1]) > unleased_at:
+            continue
+        out.append(Facility(**d))
+    return out
+
+
+def ensure_facilities(engine: Engine) -> List[Facility]:
+    """The table's facilities, seeding it from paths.facilities_file when empty."""
+    facs = db_facilities(engine)
+    if facs:
+        return facs
+    path = _resolve_path(settings.paths.facilities_file)
+    if not path.exists():
+        return []
+    stats = import_facilities(engine, load_facilities(str(path)))
+    log.info("seeded %d facilities from %s", stats["upserted"], path)
+    return db_facilities(engine)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import get_engine
+    ap = argparse.ArgumentParser(description="Manage the facilities table.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="upsert facilities from a JSON file")
+    imp.add_argument("path", nargs="?", default=settings.paths.facilities_file)
+    imp.add_argument("--prune", action="store_true", help="delete facilities missing from the file")
+    sub.add_parser("list", help="print the table as JSON")
+    args = ap.parse_args()
+    eng = get_engine()
+    if args.cmd == "import":
+        print(json.dumps(import_facilities(eng, load_facilities(args.path), prune=args.prune)))
+    else:
+        print(json.dumps([vars(f) for f in db_facilities(eng)], indent=2))
@@ -1,17 +1,61 @@
 from __future__ import annotations
-from typing import List, Dict, Any
-from icalendar import Calendar, Event
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterable, Iterator
+import zlib
+from .db import as_datetime
 
-def rows_to_ics(rows: List[Dict[str, Any]]) -> bytes:
+# Feeds are emitted event by event so a large calendar never exists as one
+# icalendar object; app.main gzips the stream once per refresh generation and
+# serves the stored bytes. icalendar is imported on first build, not at startup.
+
+_CHUNK = 64 * 1024
+
+
+def _event(r: Dict[str, Any], stamp: datetime):
+    from icalendar import Event
+    start = as_datetime(r["start_datetime"])
+    ev = Event()
+    # stable across refreshes so clients update events instead of duplicating them
+    ev.add("uid", f"{r['facility_id']}-{start:%Y%m%dT%H%M%SZ}-{r['program_name']}@quickset".replace(" ", "_"))
+    ev.add("dtstamp", stamp)
+    ev.add("summary", f"{r['program_name']} @ {r['facility_name']}")
+    ev.add("dtstart", start)
+    ev.add("dtend", as_datetime(r["end_datetime"]))
+    ev.add("location", f"{r['facility_name']}, {r.get('address','')}")
+    ev.add("description", f"Age: {r.get('age_min','?')}-{r.get('age_max','?')} | Fee: {r.get('fee_cad')} | Source: {r.get('source_url')}")
+    return ev
+
+
+def iter_ics(rows: Iterable[Dict[str, Any]], name: str | None = None) -> Iterator[bytes]:
+    from icalendar import Calendar
     cal = Calendar()
     cal.add("prodid", "-//Toronto Drop-ins//EN")
     cal.add("version", "2.0")
+    if name:
+        cal.add("x-wr-calname", name)
+    head = cal.to_ical()  # BEGIN:VCALENDAR ... END:VCALENDAR with no components
+    end = b"END:VCALENDAR\r\n"
+    yield head[: -len(end)]
+    stamp = datetime.now(timezone.utc).replace(microsecond=0)
     for r in rows:
-        ev = Event()
-        ev.add("summary", f"{r['program_name']} @ {r['facility_name']}")
-        ev.add("dtstart", r["start_datetime"])
-        ev.add("dtend", r["end_datetime"])
-        ev.add("location", f"{r['facility_name']}, {r.get('address','')}")
-        ev.add("description", f"Age: {r.get('age_min','?')}-{r.get('age_max','?')} | Fee: {r.get('fee_cad')} | Source: {r.get('source_url')}")
-        cal.add_component(ev)
-    return cal.to_ical()
+        yield _event(r, stamp).to_ical()
+    yield end
+
+
+def rows_to_ics(rows: List[Dict[str, Any]]) -> bytes:
+    return b"".join(iter_ics(rows))
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> bytes:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    out = [z.compress(c) for c in chunks]
+    out.append(z.flush())
+    return b"".join(out)
+
+
+def gunzip_chunks(body: bytes) -> Iterator[bytes]:
+    """For clients that don't accept gzip: inflate the stored feed piece by piece."""
+    z = zlib.decompressobj(31)
+    for i in range(0, len(body), _CHUNK):
+        yield z.decompress(body[i:i + _CHUNK])
+    yield z.flush()
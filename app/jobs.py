@@ -0,0 +1,190 @@
+# app/jobs.py
+from __future__ import annotations
+import json, logging, os, subprocess, sys, threading, uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from .db import as_datetime, get_engine
+from .settings import settings
+
+# Refresh runs as `python -m app.jobs <job_id>` in its own process, so a
+# multi-minute crawl never holds a web worker. refresh_jobs.active is UNIQUE
+# and only set while a job is queued/running: whoever inserts first owns the
+# crawl, everyone else (any worker, any box) joins that job instead. A
+# request for the other kind can't join it and gets JobConflict.
+
+log = logging.getLogger(__name__)
+
+JOB_KINDS = ("refresh", "dry_run")
+
+
+class JobConflict(Exception):
+    """A live job of a different kind holds the single slot."""
+
+    def __init__(self, job_id: str, kind: str):
+        super().__init__(f"a {kind} job is already running ({job_id})")
+        self.job_id, self.kind = job_id, kind
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _reap_stale(engine: Engine) -> None:
+    """Fail a live job whose worker stopped heartbeating (crash, OOM, redeploy)."""
+    cutoff = _now() - timedelta(seconds=settings.app.job_stale_seconds)
+    with engine.begin() as c:
+        c.execute(
+            text("""
+            UPDATE refresh_jobs
+            SET status = 'failed', active = NULL, finished_at = :now, error = 'worker stopped heartbeating'
+            WHERE active = 1 AND COALESCE(heartbeat_at, created_at) < :cutoff
+            """),
+            {"now": _now(), "cutoff": cutoff},
+        )
+
+
+def create_job(engine: Engine, kind: str = "refresh") -> Tuple[str, bool]:
+    """
+    Returns (job_id, created). created=False means an existing live job of
+    the same kind was joined; a live job of another kind raises JobConflict.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"unknown job kind {kind!r}")
+    _reap_stale(engine)
+    job_id = uuid.uuid4().hex
+    try:
+        with engine.begin() as c:
+            c.execute(
+                text("""
+                INSERT INTO refresh_jobs (id, kind, status, active, created_at)
+                VALUES (:id, :kind, 'queued', 1, :now)
+                """),
+                {"id": job_id, "kind": kind, "now": _now()},
+            )
+        return job_id, True
+    except IntegrityError:
+        with engine.begin() as c:
+            live = c.execute(text("SELECT id, kind FROM refresh_jobs WHERE active = 1")).first()
+        if live is None:  # finished between our insert and select; try once more
+            return create_job(engine, kind)
+        if live.kind != kind:
+            raise JobConflict(live.id, live.kind)
+        return live.id, False
+
+
+def launch_job(engine: Engine, job_id: str) -> None:
+    try:
+        subprocess.Popen(
+            [sys.executable, "-m", "app.jobs", job_id],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            start_new_session=True,  # survives the web worker being recycled
+        )
+    except OSError as e:
+        _finish(engine, job_id, "failed", error=f"spawn failed: {e}")
+        raise
+
+
+def get_job(engine: Engine, job_id: str) -> Optional[Dict[str, Any]]:
+    with engine.begin() as c:
+        row = c.execute(text("SELECT * FROM refresh_jobs WHERE id = :id"), {"id": job_id}).mappings().first()
+    if row is None:
+        return None
+    job = dict(row)
+    job.pop("active", None)
+    for k in ("created_at", "started_at", "finished_at", "heartbeat_at"):
+        job[k] = as_datetime(job[k])
+    for k in ("progress", "result"):
+        if job.get(k):
+            job[k] = json.loads(job[k])
+    return job
+
+
+def _finish(engine: Engine, job_id: str, status: str, result: Any = None, error: str | None = None) -> None:
+    with engine.begin() as c:
+        c.execute(
+            text("""
+            UPDATE refresh_jobs
+            SET status = :status, active = NULL, finished_at = :now, heartbeat_at = :now,
+                result = :result, error = :error
+            WHERE id = :id
+            """),
+            {"id": job_id, "status": status, "now": _now(),
+             "result": json.dumps(result, default=str) if result is not None else None, "error": error},
+        )
+
+
+class _Heartbeat(threading.Thread):
+    """Writes progress + heartbeat every job_heartbeat_seconds until stopped."""
+
+    def __init__(self, engine: Engine, job_id: str, progress):
+        super().__init__(daemon=True)
+        self.engine, self.job_id, self.progress = engine, job_id, progress
+        self.stopped = threading.Event()
+
+    def beat(self) -> None:
+        with self.engine.begin() as c:
+            c.execute(
+                text("UPDATE refresh_jobs SET heartbeat_at = :now, progress = :p WHERE id = :id"),
+                {"id": self.job_id, "now": _now(), "p": json.dumps(self.progress.snapshot())},
+            )
+
+    def run(self) -> None:
+        while not self.stopped.wait(settings.app.job_heartbeat_seconds):
+            try:
+                self.beat()
+            except Exception:
+                log.exception("job %s heartbeat failed", self.job_id)
+
+
+def _dry_run(progress) -> Dict[str, Any]:
+    import asyncio
+    from zoneinfo import ZoneInfo
+    from .facilities import db_facilities, load_facilities
+    from .refresh import collect_all
+    tz = ZoneInfo(settings.app.toronto_tz)
+    # read-only: seeding the facilities table is left to refresh and the worker,
+    # so before the first of those the list comes straight from the file
+    facilities = db_facilities(get_engine()) or load_facilities(settings.paths.facilities_file)
+    rows_a, rows_b = asyncio.run(collect_all(facilities, tz, progress=progress))
+    return {
+        "found": len(rows_a) + len(rows_b),
+        "by_source": {"active": len(rows_a), "facility_pages": len(rows_b)},
+        "sample": (rows_a[:1] + rows_b[:1])[:5],
+    }
+
+
+def run_job(job_id: str) -> None:
+    from .refresh import RefreshProgress, run_refresh
+    engine = get_engine()
+    with engine.begin() as c:
+        kind = c.execute(
+            text("UPDATE refresh_jobs SET status = 'running', started_at = :now, heartbeat_at = :now "
+                 "WHERE id = :id AND status = 'queued' RETURNING kind"),
+            {"id": job_id, "now": _now()},
+        ).scalar()
+    if kind is None:
+        log.warning("job %s is not queued; nothing to do", job_id)
+        return
+    progress = RefreshProgress()
+    hb = _Heartbeat(engine, job_id, progress)
+    hb.start()
+    status, result, error = "done", None, None
+    try:
+        result = _dry_run(progress) if kind == "dry_run" else run_refresh(progress)
+    except Exception as e:
+        log.exception("job %s failed", job_id)
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    finally:
+        hb.stopped.set()
+        hb.join()
+        hb.beat()  # final progress snapshot
+    _finish(engine, job_id, status, result=result, error=error)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    run_job(sys.argv[1])
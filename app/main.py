@@ -1,25 +1,76 @@
 # app/main.py
 from __future__ import annotations
 
-import os
+import asyncio, os, json, time
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 from sqlalchemy import text
 
-from fastapi import FastAPI, Query, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from .db import get_engine, insert_or_ignore
+from .db import get_engine, get_async_engine, open_async_engine, close_async_engine, day_bounds, decode_row, DAY_SQL
+from .dropin_index import IndexHolder, decode_cursor
+from .cache import GenerationClock, ResponseCache, encoded_etag, make_etag, not_modified, validator_headers
+from . import metrics
+from .ics import gunzip_chunks, gzip_chunks, iter_ics
+from .parsers import WEEKDAY_MAP, parse_age_range
+from . import snapshots
 
-import traceback, logging
-from fastapi import HTTPException
-from .refresh import  run_refresh, load_facilities, Facility
+import logging
+from .jobs import JobConflict, create_job, get_job, launch_job
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
-app = FastAPI(title="QuickSet")
+# The serving process only imports FastAPI, the DB layer and templates; the
+# crawler stack (Playwright, lxml/bs4, httpx) loads in the refresh worker.
+# tests/test_startup.py holds the import budget.
+
+_readiness: dict = {"ready": False}
+
+async def _warm_up() -> None:
+    # first requests shouldn't pay for the index build or template compile
+    t0 = time.perf_counter()
+    try:
+        eng = get_async_engine()
+        gen, _ = await _generation.aget(eng)
+        await _index.aget(eng, gen)
+        templates.get_template("home.html")
+    except Exception as e:
+        logging.getLogger(__name__).exception("warm-up failed")
+        _readiness["error"] = f"{type(e).__name__}: {e}"
+        return
+    _readiness.update(ready=True, warmup_seconds=round(time.perf_counter() - t0, 3),
+                      ready_at=datetime.now().astimezone().isoformat(timespec="seconds"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # migrations, engine creation and pool pre-fill happen here, so uvicorn
+    # only starts accepting requests once the database is warm
+    t0 = time.perf_counter()
+    _readiness.clear()
+    _readiness["ready"] = False
+    await open_async_engine()
+    _readiness["startup_seconds"] = round(time.perf_counter() - t0, 3)
+    warm = asyncio.create_task(_warm_up())
+    yield
+    warm.cancel()
+    await close_async_engine()
+
+app = FastAPI(title="QuickSet", lifespan=lifespan)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # the route template, not the raw path, keeps label cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - t0)
+    return response
 
 # Paths
 TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "app/templates")
@@ -33,25 +84,71 @@ templates = Jinja2Templates(directory=TEMPLATES_DIR)
 # Proper tzinfo object (NOT a plain string)
 TZ = ZoneInfo(os.getenv("APP__TORONTO_TZ", "America/Toronto"))
 
+_generation = GenerationClock()
+_responses = ResponseCache()
+_feeds = ResponseCache()  # gzip'd ICS bodies; separate so big feeds don't evict pages
+
+def _json_bytes(data) -> bytes:
+    return json.dumps(jsonable_encoder(data), separators=(",", ":")).encode("utf-8")
+
+async def _cached_response(request: Request, endpoint: str, params: dict, build, media_type: str,
+                           snapshot: str | None = None) -> Response:
+    # one cheap generation read (shared, TTL'd) instead of the real query;
+    # the body is built at most once per (endpoint, params, generation)
+    gen, updated_at = await _generation.aget(get_async_engine())
+    etag = make_etag(endpoint, params, gen)
+    if snapshot is not None:
+        found = snapshots.find(snapshot, gen, request.headers.get("accept-encoding", ""))
+        if found is not None:
+            return await _snapshot_response(request, found, (endpoint, tuple(sorted(params.items())), gen),
+                                            etag, updated_at, media_type)
+    headers = validator_headers(etag, updated_at)
+    if snapshot is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if not_modified(request.headers, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+    body = await _responses.aget_or_build((endpoint, tuple(sorted(params.items())), gen), build)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def _snapshot_response(request: Request, found, key: tuple, etag: str, updated_at: datetime,
+                             media_type: str) -> Response:
+    # fast path: pre-rendered, pre-compressed by refresh; no query, no render
+    path, encoding = found
+    etag = encoded_etag(etag, encoding)
+    headers = validator_headers(etag, updated_at)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if not_modified(request.headers, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+
+    async def read() -> bytes:
+        return await asyncio.to_thread(path.read_bytes)
+
+    body = await _responses.aget_or_build(key + (encoding,), read)
+    return Response(content=body, media_type=media_type, headers=headers)
+
 @app.get("/count")
-def count_rows():
-    eng = get_engine()
-    with eng.begin() as c:
-        n = c.execute(text("SELECT COUNT(*) FROM dropins")).scalar()
-    return {"rows": int(n or 0)}
+async def count_rows(request: Request):
+    async def build() -> bytes:
+        async with get_async_engine().connect() as c:
+            n = (await c.execute(text("SELECT COUNT(*) FROM dropins"))).scalar()
+        return _json_bytes({"rows": int(n or 0)})
+    return await _cached_response(request, "count", {}, build, "application/json")
 
 @app.get("/recent")
-def recent(limit: int = 25):
-    eng = get_engine()
+async def recent(request: Request, limit: int = 25):
     q = """
     SELECT facility_name, program_name, start_datetime, end_datetime, address, fee_cad
     FROM dropins
     ORDER BY start_datetime DESC
     LIMIT :lim
     """
-    with eng.begin() as c:
-        rows = [dict(r._mapping) for r in c.execute(text(q), {"lim": limit})]
-    return {"rows": rows}
+    async def build() -> bytes:
+        async with get_async_engine().connect() as c:
+            rows = [decode_row(r._mapping, TZ) for r in await c.execute(text(q), {"lim": limit})]
+        return _json_bytes({"rows": rows})
+    return await _cached_response(request, "recent", {"limit": limit}, build, "application/json")
 
 
 def _resolve_day(day: str | None) -> date:
@@ -65,137 +162,179 @@ def _resolve_day(day: str | None) -> date:
         return today - timedelta(days=1)
     return date.fromisoformat(day)  # YYYY-MM-DD
 
+_WEEKDAYS = {name.lower(): i for i, name in WEEKDAY_MAP.items()}
+
+def _parse_weekday(day: str) -> int:
+    key = day.strip().lower()[:3]
+    if key not in _WEEKDAYS:
+        raise HTTPException(status_code=400, detail=f"bad day: {day!r} (use Mon..Sun)")
+    return _WEEKDAYS[key]
+
+def _parse_hhmm(value: str) -> int:
+    try:
+        t = datetime.strptime(value.strip(), "%H:%M")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"bad time: {value!r} (use HH:MM)")
+    return t.hour * 60 + t.minute
+
+_index = IndexHolder(TZ)
+
+@app.get("/dropins")
+async def dropins(
+    day: str | None = None,
+    after: str | None = None,
+    before: str | None = None,
+    district: str | None = None,
+    age: str | None = None,
+    max_fee: float | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+):
+    """Upcoming sessions, e.g. /dropins?day=Tue&after=18:00&district=South&age=19+"""
+    age_years = None
+    if age:
+        # "19+" arrives as "19 " unless the client escapes the plus
+        age_years = int(age.strip()) if age.strip().isdigit() else parse_age_range(age)[0]
+        if age_years is None:
+            raise HTTPException(status_code=400, detail=f"bad age: {age!r}")
+    after_key = None
+    if cursor:
+        try:
+            after_key = decode_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="bad cursor")
+    eng = get_async_engine()
+    gen, _ = await _generation.aget(eng)
+    rows, next_cursor = (await _index.aget(eng, gen)).query(
+        weekday=_parse_weekday(day) if day else None,
+        after_minute=_parse_hhmm(after) if after else None,
+        before_minute=_parse_hhmm(before) if before else None,
+        district=district,
+        age=age_years,
+        max_fee=max_fee,
+        cursor=after_key,
+        limit=limit,
+    )
+    return {"rows": rows, "next_cursor": next_cursor}
+
+async def _ics_response(request: Request, feed: str, params: dict, name: str, select) -> Response:
+    eng = get_async_engine()
+    gen, updated_at = await _generation.aget(eng)
+    gz = "gzip" in request.headers.get("accept-encoding", "")
+    etag = encoded_etag(make_etag(f"ics-{feed}", params, gen), "gzip" if gz else "identity")
+    headers = validator_headers(etag, updated_at)
+    headers["Vary"] = "Accept-Encoding"
+    if not_modified(request.headers, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+    index = await _index.aget(eng, gen)
+
+    async def build() -> bytes:
+        # once per (feed, generation); events are encoded and compressed as a stream
+        return await asyncio.to_thread(lambda: gzip_chunks(iter_ics(select(index), name)))
+
+    body = await _feeds.aget_or_build((feed, tuple(sorted(params.items())), gen), build)
+    media_type = "text/calendar; charset=utf-8"
+    if gz:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type=media_type, headers=headers)
+    return StreamingResponse(gunzip_chunks(body), media_type=media_type, headers=headers)
+
+@app.get("/ics/facility/{facility_id}.ics")
+async def ics_facility(request: Request, facility_id: str):
+    return await _ics_response(request, "facility", {"id": facility_id}, f"Volleyball drop-ins: {facility_id}",
+                               lambda idx: idx.iter_rows(facility_id=facility_id))
+
+@app.get("/ics/district/{district}.ics")
+async def ics_district(request: Request, district: str):
+    return await _ics_response(request, "district", {"district": district.lower()}, f"Volleyball drop-ins: {district}",
+                               lambda idx: idx.iter_rows(district=district))
+
+@app.get("/ics/day/{day}.ics")
+async def ics_weekday(request: Request, day: str):
+    wd = _parse_weekday(day)
+    return await _ics_response(request, "day", {"weekday": wd}, f"Volleyball drop-ins: {WEEKDAY_MAP[wd]}",
+                               lambda idx: idx.iter_rows(weekday=wd))
+
+@app.get("/ics")
+async def ics_legacy(request: Request, id: str):
+    return await ics_facility(request, id)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text format: web metrics plus the last refresh run's textfile."""
+    metrics.sample_pool(get_async_engine().sync_engine)
+    return Response(content=metrics.render_web(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ready", include_in_schema=True)
+async def ready():
+    """Readiness (vs /health liveness): 503 until post-startup warm-up has finished."""
+    return Response(content=_json_bytes(_readiness), media_type="application/json",
+                    status_code=200 if _readiness["ready"] else 503)
+
 @app.get("/health", include_in_schema=True)
-def health():
+async def health():
     return {"status": "ok"}
 
 @app.get("/__routes__", include_in_schema=True)
-def routes():
+async def routes():
     return [getattr(r, "path", None) for r in app.router.routes]
 
 @app.get("/db_ping", include_in_schema=True)
-def db_ping():
-    eng = get_engine()
-    with eng.begin() as conn:
-        one = conn.execute(text("SELECT 1")).scalar()
+async def db_ping():
+    async with get_async_engine().connect() as conn:
+        one = (await conn.execute(text("SELECT 1"))).scalar()
     return {"ok": one == 1}
 
-# helper to run collectors without writing to DB
-def _run_refresh_debug():
-    from .refresh import load_facilities  # your loader
-    # try to import collectors; tolerate missing ones
-    try:
-        from .collectors.active_communities import collect_from_active
-    except Exception:
-        collect_from_active = None
+# job bookkeeping is sync (shared with the worker process); FastAPI runs
+# these two in its threadpool
+@app.post("/refresh", status_code=202, include_in_schema=True)
+def refresh_now(dry_run: bool = Query(False)):
+    """Start (or join) the background refresh; poll GET /refresh/{job_id}."""
+    eng = get_engine()
     try:
-        from .collectors.facility_pages import collect_from_dropin_page_async
-    except Exception:
-        collect_from_dropin_page_async = None
-
-    facs = load_facilities(os.getenv("PATHS__FACILITIES_FILE", "facilities.json"))
-    meta = {"active": 0, "facility_pages": 0}
-    rows = []
-
-    # A) Active listings (requests/bs4)
-    if collect_from_active:
-        for fac in facs:
-            try:
-                found = collect_from_active(fac, TZ)
-                meta["active"] += len(found)
-                rows.extend(found)
-            except Exception as e:
-                logging.exception("active parser failed for %s: %s", fac.get("facility_name","?"), e)
-
-    # B) Facility “Drop-in Programs” pages (Playwright)
-    if collect_from_dropin_page_async:
+        job_id, created = create_job(eng, "dry_run" if dry_run else "refresh")
+    except JobConflict as e:
+        # joining would hand back a job that doesn't do what was asked
+        raise HTTPException(status_code=409, detail={"error": str(e), "job_id": e.job_id, "kind": e.kind,
+                                                     "status_url": f"/refresh/{e.job_id}"})
+    if created:
         try:
-            import asyncio
-            async def go():
-                return await collect_from_dropin_page_async(facs, TZ)
-            found_b = asyncio.run(go()) or []
-            meta["facility_pages"] += len(found_b)
-            rows.extend(found_b)
-        except Exception as e:
-            logging.exception("facility pages parser failed: %s", e)
+            launch_job(eng, job_id)
+        except OSError as e:
+            raise HTTPException(status_code=500, detail={"type": type(e).__name__, "error": str(e)})
+    return {"job_id": job_id, "joined": not created, "status_url": f"/refresh/{job_id}"}
 
-    return rows, meta
+@app.get("/refresh/{job_id}", include_in_schema=True)
+def refresh_status(job_id: str):
+    job = get_job(get_engine(), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="no such job")
+    return job
 
-from .db import get_engine, insert_or_ignore
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request, day: str = Query(default="today")):
+    selected = _resolve_day(day)
+    async def build() -> bytes:
+        rows = await _day_rows(selected)
+        return templates.get_template("home.html").render(snapshots.day_context(selected, rows, TZ)).encode("utf-8")
+    # key on the resolved date so "today" rolls over at midnight
+    return await _cached_response(request, "home", {"day": selected.isoformat()}, build, "text/html; charset=utf-8",
+                                  snapshot=f"home-{selected.isoformat()}.html")
 
-@app.post("/refresh", include_in_schema=True)
-def refresh_now(dry_run: bool = Query(False)):
+@app.get("/day/{day}.json")
+async def day_json(request: Request, day: str):
+    """The home page's rows as JSON; day is YYYY-MM-DD, today or tomorrow."""
     try:
-        if dry_run:
-            # debug: run both collectors but do NOT write to DB
-            facs = load_facilities("facilities.json")
-            found_total = 0
-            by_source = {"active": 0, "facility_pages": 0}
-            rows_preview = []
-
-            # A) Active
-            try:
-                from .collectors.active_communities import collect_from_active
-                for fac in facs:
-                    r = collect_from_active(fac, TZ)
-                    by_source["active"] += len(r)
-                    found_total += len(r)
-                    rows_preview.extend(r[:1])  # grab a few
-            except Exception:
-                logging.exception("active debug failed")
-
-            # B) Facility pages
-            try:
-                from .collectors.facility_pages import collect_from_dropin_page_async
-                import asyncio
-                async def go():
-                    tasks = [collect_from_dropin_page_async(f, TZ) for f in facs if f.dropin_page_url]
-                    if not tasks:
-                        return []
-                    res = await asyncio.gather(*tasks, return_exceptions=True)
-                    out = []
-                    for rr in res:
-                        if isinstance(rr, Exception):
-                            logging.exception("facility debug task failed: %s", rr)
-                        else:
-                            out.extend(rr)
-                    return out
-                rows_b = asyncio.run(go())
-                by_source["facility_pages"] += len(rows_b)
-                found_total += len(rows_b)
-                rows_preview.extend(rows_b[:1])
-            except Exception:
-                logging.exception("facility pages debug failed")
-
-            # JSON-safe preview (datetimes → isoformat)
-            for r in rows_preview:
-                for k in ("start_datetime","end_datetime","last_seen"):
-                    if k in r and hasattr(r[k], "isoformat"):
-                        r[k] = r[k].isoformat()
-
-            return {"status":"ok","found":found_total,"by_source":by_source,"sample":rows_preview[:5]}
-
-        # real insert
-        inserted = run_refresh()
-        return {"status":"ok","inserted":inserted}
-    except Exception as e:
-        logging.exception("refresh failed")
-        tb = traceback.format_exc()
-        raise HTTPException(status_code=500, detail={"type":type(e).__name__,"error":str(e),"trace":tb[-1800:]})
+        selected = _resolve_day(day)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"bad day: {day!r} (use YYYY-MM-DD)")
+    async def build() -> bytes:
+        return snapshots.day_json(selected, await _day_rows(selected))
+    return await _cached_response(request, "day", {"day": selected.isoformat()}, build, "application/json",
+                                  snapshot=f"day-{selected.isoformat()}.json")
 
-@app.get("/", response_class=HTMLResponse)
-def home(request: Request, day: str = Query(default="today")):
-    selected = _resolve_day(day)
-    eng = get_engine()
-    q = """
-    SELECT facility_name, program_name, start_datetime, end_datetime, address, fee_cad
-    FROM dropins
-    WHERE DATE(start_datetime AT TIME ZONE 'America/Toronto') = :ymd
-    ORDER BY start_datetime, facility_name
-    """
-    with eng.begin() as conn:
-        rows = [dict(r._mapping) for r in conn.execute(text(q), {"ymd": selected.isoformat()})]
-    return templates.TemplateResponse(
-        "home.html",
-        {"request": request, "selected": selected.isoformat(), "rows": rows, "tz": TZ},
-    )
+async def _day_rows(selected: date) -> list:
+    day_start, next_day_start = day_bounds(selected, TZ)
+    async with get_async_engine().connect() as conn:
+        return [decode_row(r._mapping, TZ) for r in await conn.execute(
+            text(DAY_SQL), {"day_start": day_start, "next_day_start": next_day_start})]
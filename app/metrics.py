@@ -0,0 +1,135 @@
+# app/metrics.py
+from __future__ import annotations
+import contextlib, logging, os, time
+from pathlib import Path
+from typing import Any, Dict, Iterator
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, write_to_textfile
+from .settings import settings
+
+# Two registries: WEB lives in the uvicorn process and is scraped directly;
+# REFRESH is filled by whichever process runs a refresh (job subprocess or
+# cron) and written to a textfile at the end of the run, which /metrics
+# appends. Keeping them apart means no metric family is ever emitted twice.
+
+log = logging.getLogger(__name__)
+
+WEB = CollectorRegistry()
+REFRESH = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "quickset_http_request_seconds", "API latency by route template",
+    ["method", "route", "status"], registry=WEB,
+)
+DB_POOL = Gauge(
+    "quickset_db_pool_connections", "Async pool connections by state (sampled at scrape)",
+    ["state"], registry=WEB,
+)
+
+# observed once per facility (fetch/parse/normalize) or per writer flush (write)
+STEP_SECONDS = Histogram(
+    "quickset_refresh_step_seconds", "Refresh step duration per facility or flush",
+    ["source", "step"], registry=REFRESH,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ROWS = Counter(
+    "quickset_refresh_rows_total", "Rows by source and outcome (found/inserted/updated/unchanged)",
+    ["source", "outcome"], registry=REFRESH,
+)
+PAGES = Counter(
+    "quickset_refresh_pages_total", "Fetched pages by source and result (parsed/unchanged/failed)",
+    ["source", "result"], registry=REFRESH,
+)
+FETCH_TIER = Counter(
+    "quickset_refresh_fetch_tier_total", "Pages by how they had to be fetched (http/browser)",
+    ["source", "tier"], registry=REFRESH,
+)
+PAGE_BYTES = Histogram(
+    "quickset_refresh_page_bytes", "Bytes transferred per browser page load (Content-Length sum)",
+    ["source"], registry=REFRESH,
+    buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6),
+)
+BLOCKED = Counter(
+    "quickset_refresh_blocked_requests_total", "Browser subrequests aborted by the light load profile",
+    ["source", "resource_type"], registry=REFRESH,
+)
+REFRESH_SECONDS = Gauge(
+    "quickset_refresh_phase_seconds", "Wall time of each phase of the last refresh",
+    ["phase"], registry=REFRESH,
+)
+REFRESH_FINISHED = Gauge(
+    "quickset_refresh_last_finished_timestamp_seconds", "When the last refresh finished",
+    registry=REFRESH,
+)
+
+
+def observe(source: str, step: str, seconds: float) -> None:
+    STEP_SECONDS.labels(source, step).observe(seconds)
+
+
+@contextlib.contextmanager
+def timed(source: str, step: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STEP_SECONDS.labels(source, step).observe(time.perf_counter() - t0)
+
+
+def sample_pool(engine: Any) -> None:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):  # NullPool/StaticPool: nothing to report
+        return
+    DB_POOL.labels("checked_out").set(pool.checkedout())
+    DB_POOL.labels("idle").set(pool.checkedin())
+    DB_POOL.labels("overflow").set(max(0, pool.overflow()))
+    DB_POOL.labels("size").set(pool.size())
+
+
+def write_refresh_textfile() -> None:
+    path = Path(settings.paths.metrics_textfile)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_to_textfile(str(path), REFRESH)  # atomic (tmp + rename)
+    except OSError:
+        log.exception("could not write refresh metrics to %s", path)
+
+
+def render_web() -> bytes:
+    body = generate_latest(WEB)
+    path = settings.paths.metrics_textfile
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                body += f.read()
+        except OSError:
+            pass
+    return body
+
+
+# Optional tracing: OpenTelemetry spans when tracing_enabled and the API is
+# installed; otherwise span() hands back one shared no-op context manager.
+
+_NOOP = contextlib.nullcontext()
+_tracer: Any = None
+_tracing = settings.app.tracing_enabled
+
+
+def span(name: str, **attributes: Any):
+    global _tracer, _tracing
+    if not _tracing:
+        return _NOOP
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            log.warning("tracing_enabled but opentelemetry-api is not installed; spans disabled")
+            _tracing = False
+            return _NOOP
+        _tracer = trace.get_tracer("quickset")
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def record_phases(phases: Dict[str, float]) -> None:
+    for phase, seconds in phases.items():
+        REFRESH_SECONDS.labels(phase).set(seconds)
+    REFRESH_FINISHED.set_to_current_time()
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import re
 from datetime import datetime, date, timedelta
-from dateutil import parser as dateparser
+from functools import lru_cache
 from typing import Optional, Tuple
 from zoneinfo import ZoneInfo
 
@@ -15,35 +15,81 @@ WEEKDAY_MAP = {
     6: "Sun",
 }
 
+_AGE_RANGE_RE = re.compile(r"(\d+)\s*[–-]\s*(\d+)")
+_AGE_PLUS_RE = re.compile(r"(\d+)\s*\+")
+_AGE_ADULT_RE = re.compile(r"(\d+)\s*(?:years?)?\s*(?:\+|and\s*older)")
+_RANGE_SPLIT_RE = re.compile(r"\s*(?:-|to|–|—)\s*", re.IGNORECASE)
+# "7:30 PM", "07:30PM", "7pm", "7 p.m.", "19:30"
+_CLOCK_RE = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*(?:([ap])\.?\s*m\.?)?", re.IGNORECASE)
+_WEEK_RE = re.compile(r"week\s+of\s+(\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+# "Week of September 8, 2025", "week of Sept. 8 2025"
+_WEEK_TEXT_RE = re.compile(r"week\s+of\s+([a-z]{3})[a-z]*\.?\s+(\d{1,2}),?\s+(\d{4})", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
 def parse_age_range(text: str) -> Tuple[Optional[int], Optional[int]]:
     s = (text or "").strip().lower()
     if not s:
         return (None, None)
     if "all ages" in s:
         return (None, None)
-    m_range = re.search(r"(\d+)\s*[–-]\s*(\d+)", s)
+    m_range = _AGE_RANGE_RE.search(s)
     if m_range:
         return (int(m_range.group(1)), int(m_range.group(2)))
-    m_plus = re.search(r"(\d+)\s*\+", s)
+    m_plus = _AGE_PLUS_RE.search(s)
     if m_plus:
         return (int(m_plus.group(1)), None)
-    m_adult = re.search(r"(\d+)\s*(?:years?)?\s*(?:\+|and\s*older)", s)
+    m_adult = _AGE_ADULT_RE.search(s)
     if m_adult:
         return (int(m_adult.group(1)), None)
     return (None, None)
 
-def parse_time_range(text: str, ref_date: date, tz: ZoneInfo):
-    s = (text or "").strip()
-    parts = re.split(r"\s*(?:-|to|–|—)\s*", s, maxsplit=1, flags=re.IGNORECASE)
+WallClock = Tuple[int, int]
+
+def _clock(token: str) -> Optional[WallClock]:
+    m = _CLOCK_RE.fullmatch(token)
+    if not m:
+        return None
+    hour, minute = int(m.group(1)), int(m.group(2) or 0)
+    if minute > 59:
+        return None
+    if m.group(3):
+        if not 1 <= hour <= 12:
+            return None
+        return (hour % 12 + (12 if m.group(3).lower() == "p" else 0), minute)
+    # bare "7" is ambiguous (dateutil reads it as a day of month); leave it to dateutil
+    if m.group(2) is None or hour > 23:
+        return None
+    return (hour, minute)
+
+@lru_cache(maxsize=4096)
+def _wall_clock_range(text: str) -> Optional[Tuple[WallClock, Optional[WallClock]]]:
+    """
+    Fast path for the common 12h/24h ranges. Memoizes wall-clock (hour,
+    minute) only — never aware datetimes — so one entry is right for any
+    date, DST or not. None means "not a simple range, ask dateutil".
+    """
+    parts = _RANGE_SPLIT_RE.split(text, maxsplit=1)
+    if len(parts) != 2:
+        start = _clock(text)
+        return (start, None) if start else None
+    start, end = _clock(parts[0]), _clock(parts[1])
+    if start is None or end is None:
+        return None
+    return (start, end)
+
+def _parse_time_range_slow(s: str, ref_date: date, tz: ZoneInfo):
+    from dateutil import parser as dateparser  # fallback only; keeps the web process from importing it
+    default = datetime(ref_date.year, ref_date.month, ref_date.day, 0, 0)
+    parts = _RANGE_SPLIT_RE.split(s, maxsplit=1)
     if len(parts) != 2:
-        dt = dateparser.parse(s, default=datetime(ref_date.year, ref_date.month, ref_date.day, 0, 0))
+        dt = dateparser.parse(s, default=default)
         start = dt.replace(tzinfo=tz)
         end = start + timedelta(hours=1)
         return start, end
 
     left, right = parts
-    dleft = dateparser.parse(left, default=datetime(ref_date.year, ref_date.month, ref_date.day, 0, 0))
-    dright = dateparser.parse(right, default=datetime(ref_date.year, ref_date.month, ref_date.day, 0, 0))
+    dleft = dateparser.parse(left, default=default)
+    dright = dateparser.parse(right, default=default)
 
     start = dleft.replace(tzinfo=tz)
     end = dright.replace(tzinfo=tz)
@@ -51,16 +97,35 @@ def parse_time_range(text: str, ref_date: date, tz: ZoneInfo):
         end = end + timedelta(days=1)
     return start, end
 
+def parse_time_range(text: str, ref_date: date, tz: ZoneInfo):
+    s = (text or "").strip()
+    wall = _wall_clock_range(s)
+    if wall is None:
+        return _parse_time_range_slow(s, ref_date, tz)
+    (sh, sm), end_wall = wall
+    start = datetime(ref_date.year, ref_date.month, ref_date.day, sh, sm, tzinfo=tz)
+    if end_wall is None:
+        return start, start + timedelta(hours=1)
+    end = datetime(ref_date.year, ref_date.month, ref_date.day, end_wall[0], end_wall[1], tzinfo=tz)
+    if end <= start:
+        end = end + timedelta(days=1)
+    return start, end
+
 def parse_week_header(text: str) -> Optional[date]:
     if not text:
         return None
-    m = re.search(r"week\s+of\s+(\d{4}-\d{2}-\d{2})", text, re.IGNORECASE)
-    if m:
-        d = dateparser.parse(m.group(1)).date()
-        while d.weekday() != 0:
-            d = d - timedelta(days=1)
-        return d
-    return None
+    try:
+        m = _WEEK_RE.search(text)
+        if m:
+            d = date.fromisoformat(m.group(1))
+        else:
+            m = _WEEK_TEXT_RE.search(text)
+            if not m:
+                return None
+            d = datetime.strptime(f"{m.group(1).title()} {m.group(2)} {m.group(3)}", "%b %d %Y").date()
+    except ValueError:
+        return None
+    return d - timedelta(days=d.weekday())
 
 def iso_weekday_name(d: date) -> str:
     return WEEKDAY_MAP[d.weekday()]
@@ -1,100 +1,359 @@
 # app/refresh.py
 from __future__ import annotations
-import json
-from dataclasses import dataclass
-from pathlib import Path
-from typing import List
+import asyncio, json, logging, os, socket, threading, time, uuid
+from typing import Any, Dict, List, Tuple
 from zoneinfo import ZoneInfo
-from datetime import datetime
-
-from .db import get_engine, insert_or_ignore
-
-@dataclass
-class Facility:
-    facility_id: str
-    facility_name: str
-    district: str = ""
-    address: str = ""
-    # names your collectors expect:
-    active_search_url: str | None = None
-    dropin_page_url: str | None = None
-
-def _resolve_path(path: str) -> Path:
-    p = Path(path)
-    if not p.is_absolute():
-        # repo root relative to app/
-        base = Path(__file__).resolve().parent.parent
-        p = (base / p).resolve()
-    return p
-
-def load_facilities(path: str = "facilities.json") -> List[Facility]:
-    p = _resolve_path(path)
-    data = json.loads(p.read_text(encoding="utf-8"))
-    facs: List[Facility] = []
-    for d in data:
-        facs.append(
-            Facility(
-                facility_id=d["facility_id"],
-                facility_name=d["facility_name"],
-                district=d.get("district", ""),
-                address=d.get("address", ""),
-                # be flexible with possible alt keys in your JSON:
-                active_search_url=d.get("active_search_url") or d.get("active_url") or d.get("activeSearchUrl"),
-                dropin_page_url=d.get("dropin_page_url") or d.get("dropin_url") or d.get("dropinPageUrl"),
-            )
-        )
-    return facs
+from datetime import datetime, timezone
 
-# Optional: keep this function if you want a single entry point
-def run_refresh() -> int:
-    from .collectors.active_communities import collect_from_active
-    from .collectors.facility_pages import collect_from_dropin_page_async
+from .db import get_engine, upsert_dropins, bump_generation, touch_last_seen
+from .facilities import Facility, db_facilities, ensure_facilities, load_facilities  # noqa: F401
+from .settings import settings
+from . import metrics
 
-    tz = ZoneInfo("America/Toronto")
-    facilities = load_facilities("facilities.json")
+log = logging.getLogger(__name__)
+
+class RefreshProgress:
+    """
+    Per-facility status for a refresh: {facility_id: {stage: {status, rows,
+    seconds, error}}} plus run totals. Thread-safe so a job heartbeat can
+    snapshot it while the event loop is updating it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.facilities: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.totals: Dict[str, Any] = {}
+
+    def facility(self, facility_id: str, stage: str, **fields: Any) -> None:
+        with self._lock:
+            self.facilities.setdefault(facility_id, {}).setdefault(stage, {}).update(fields)
+
+    def total(self, **fields: Any) -> None:
+        with self._lock:
+            self.totals.update(fields)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps({"facilities": self.facilities, "totals": self.totals}, default=str))
+
+async def _tracked(progress: RefreshProgress | None, fac: Facility, stage: str, coro) -> List[Dict[str, Any]]:
+    if progress is None:
+        return await coro
+    progress.facility(fac.facility_id, stage, status="running")
+    t0 = time.perf_counter()
+    try:
+        rows = await coro
+    except Exception as e:
+        progress.facility(fac.facility_id, stage, status="failed", error=f"{type(e).__name__}: {e}",
+                          seconds=round(time.perf_counter() - t0, 3))
+        raise
+    progress.facility(fac.facility_id, stage, status="done", rows=len(rows),
+                      seconds=round(time.perf_counter() - t0, 3))
+    return rows
+
+_DEFERRED = object()  # facility skipped because the run's time budget ran out
 
-    all_rows = []
+async def _bounded(facilities: List[Facility], concurrency: int, fn, deadline: float | None, sink=None) -> list:
+    """
+    Run fn(fac) with at most `concurrency` in flight; once `deadline`
+    (time.monotonic) passes, remaining facilities are deferred, not started.
+    With a `sink`, each facility's rows are handed to it (which may block,
+    pausing this worker) instead of being kept in the result.
+    """
+    results: list = [_DEFERRED] * len(facilities)
+    pending = iter(range(len(facilities)))
+
+    async def worker() -> None:
+        for i in pending:  # shared iterator: each index handed out once
+            if deadline is not None and time.monotonic() >= deadline:
+                continue
+            try:
+                rows = await fn(facilities[i])
+                if sink is not None:
+                    await sink(rows)
+                    rows = []
+                results[i] = rows
+            except Exception as e:
+                results[i] = e
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(facilities))))))
+    return results
+
+def _gather_rows(results: list, facilities: List[Facility], what: str,
+                 progress: RefreshProgress | None = None, stage: str = "") -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for fac, r in zip(facilities, results):
+        if r is _DEFERRED:
+            if progress is not None:
+                progress.facility(fac.facility_id, stage, status="deferred")
+        elif isinstance(r, Exception):
+            # don't crash entire run; collectors may fail for some centres
+            log.error("%s failed for %s", what, fac.facility_name, exc_info=r)
+        elif r:
+            rows.extend(r)
+    return rows
+
+async def collect_all(
+    facilities: List[Facility],
+    tz: ZoneInfo,
+    cache=None,
+    progress: RefreshProgress | None = None,
+    deadline: float | None = None,
+    sink=None,
+    strategies=None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    A) Active Communities search (pooled httpx) and B) facility "Drop-in
+    Programs" pages (plain HTTP, Playwright when `strategies` says the page
+    needs rendering) run concurrently; both go through one
+    per-host throttle so the city's servers see a single polite client.
+    Facilities not started by `deadline` are left for the next run.
+    If `sink(stage, rows)` is given, rows stream to it per facility and the
+    returned lists are empty.
+    """
+    from .collectors.active_communities import collect_from_active_async
+    from .collectors.facility_pages import collect_from_dropin_page_async, BrowserPool
+    from .collectors.http import make_client
+    from .collectors.throttle import HostThrottle
+
+    throttle = HostThrottle()
+    active = [f for f in facilities if f.active_search_url]
+    pages = [f for f in facilities if f.dropin_page_url]
+
+    async def stage_a(client) -> List[Dict[str, Any]]:
+        if not active:
+            return []
+        with metrics.span("refresh.collect.active", facilities=len(active)):
+            results = await _bounded(
+                active, settings.app.http_max_connections,
+                lambda f: _tracked(progress, f, "active", collect_from_active_async(f, tz, client, throttle, cache)),
+                deadline, sink and (lambda rows: sink("active", rows)),
+            )
+        return _gather_rows(results, active, "Active parse", progress, "active")
 
-    # A) Active Communities (sync)
-    for fac in facilities:
+    async def stage_b(client) -> List[Dict[str, Any]]:
+        if not pages:
+            return []
         try:
-            rows = collect_from_active(fac, tz)
-            all_rows.extend(rows)
+            # one browser for the whole run, started only if some page needs it;
+            # the pool caps concurrent pages
+            with metrics.span("refresh.collect.facility_page", facilities=len(pages)):
+                async with BrowserPool(throttle=throttle) as pool:
+                    results = await _bounded(
+                        pages, pool.size,
+                        lambda f: _tracked(progress, f, "facility_page",
+                                           collect_from_dropin_page_async(f, tz, pool, cache, client, strategies)),
+                        deadline, sink and (lambda rows: sink("facility_page", rows)),
+                    )
         except Exception:
-            # don't crash entire run; collectors may fail for some centres
-            import logging; logging.exception("Active parse failed for %s", fac.facility_name)
-
-    # B) Facility “Drop-in Programs” pages (async, per-facility)
-    import asyncio
-    async def go():
-        from itertools import chain
-        tasks = []
-        for fac in facilities:
-            if not fac.dropin_page_url:
-                continue
-            tasks.append(collect_from_dropin_page_async(fac, tz))
-        if not tasks:
+            log.exception("Facility pages stage failed")
             return []
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        rows = []
-        for r in results:
-            if isinstance(r, Exception):
-                import logging; logging.exception("Facility page task failed: %s", r)
-            elif r:
-                rows.extend(r)
-        return rows
+        return _gather_rows(results, pages, "Facility page", progress, "facility_page")
 
-    try:
-        rows_b = asyncio.run(go())
-        # merge, avoiding duplicates (same unique key as DB)
-        seen = {(r["facility_id"], r["start_datetime"], r["program_name"]) for r in all_rows}
-        for r in rows_b:
-            key = (r["facility_id"], r["start_datetime"], r["program_name"])
-            if key not in seen:
-                all_rows.append(r)
-                seen.add(key)
-    except Exception:
-        import logging; logging.exception("Facility pages stage failed")
+    # one pooled client: both stages mostly hit the same city hosts
+    async with make_client() as client:
+        rows_a, rows_b = await asyncio.gather(stage_a(client), stage_b(client))
+    return rows_a, rows_b
+
+class RowWriter:
+    """
+    Drains per-facility row batches from a bounded queue into upsert_dropins.
+    Flushes once `batch_rows` rows are buffered or `flush_seconds` after the
+    first one arrived; a facility's rows always land in the same commit. A
+    full queue blocks the collectors, so memory doesn't grow with the number
+    of facilities and a crash only loses what is still buffered.
+    """
+
+    def __init__(self, engine, batch_rows: int | None = None, flush_seconds: float | None = None,
+                 maxsize: int | None = None):
+        self.engine = engine
+        self.batch_rows = batch_rows or settings.app.write_batch_rows
+        self.flush_seconds = settings.app.write_flush_seconds if flush_seconds is None else flush_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize or settings.app.write_queue_size)
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+        self.found = 0
+        self.flushes = 0
+        self.write_seconds = 0.0
+        self.error: Exception | None = None
 
+    async def put(self, stage: str, rows: List[Dict[str, Any]]) -> None:
+        if self.error is not None:
+            raise RuntimeError("refresh writer failed") from self.error
+        if rows:
+            metrics.ROWS.labels(stage, "found").inc(len(rows))
+            await self.queue.put((stage, rows))
+
+    async def close(self) -> None:
+        await self.queue.put(None)
+
+    def _write(self, batch: List[Tuple[str, List[Dict[str, Any]]]]) -> None:
+        t0 = time.perf_counter()
+        # Active rows first and unconditionally; facility-page rows only fill gaps
+        for stage in ("active", "facility_page"):
+            rows = [r for s, rs in batch if s == stage for r in rs]
+            if rows:
+                with metrics.timed(stage, "write"):
+                    res = upsert_dropins(self.engine, rows, same_source_only=stage != "active")
+                for k, v in res.items():
+                    self.stats[k] += v
+                    metrics.ROWS.labels(stage, k).inc(v)
+        self.flushes += 1
+        self.write_seconds += time.perf_counter() - t0
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[str, List[Dict[str, Any]]]] = []
+        buffered, first_at, done = 0, 0.0, False
+        while not done:
+            timeout = max(0.0, first_at + self.flush_seconds - loop.time()) if batch else None
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ()  # flush timer
+            if item is None:
+                done = True
+            elif item:
+                if not batch:
+                    first_at = loop.time()
+                batch.append(item)
+                buffered += len(item[1])
+                self.found += len(item[1])
+            if batch and (done or buffered >= self.batch_rows or loop.time() >= first_at + self.flush_seconds):
+                if self.error is None:  # after a failure, keep draining so collectors never block forever
+                    try:
+                        await asyncio.to_thread(self._write, batch)
+                    except Exception as e:
+                        log.exception("refresh writer failed")
+                        self.error = e
+                batch, buffered = [], 0
+        if self.error is not None:
+            raise self.error
+
+# Optional: keep this function if you want a single entry point
+def run_refresh(
+    progress: RefreshProgress | None = None,
+    budget_seconds: float | None = None,
+    max_facilities: int | None = None,
+    all_facilities: bool = False,
+    claimed: List[Facility] | None = None,
+) -> Dict[str, Any]:
+    """
+    Crawl the facilities that are due (see app.scheduler), stalest and
+    recently-changed first, within an optional time and count budget.
+    The run leases what it crawls (app.scheduler.claim_due) for its
+    duration, so a concurrent app.worker never picks the same facility;
+    those a worker already holds are left to it. `claimed` (from
+    app.worker, which holds the leases itself) crawls exactly those instead.
+    """
+    from .collectors.fetch_cache import FetchCache
+    from .collectors.fetch_strategy import FetchStrategies
+    from .collectors import parse_pool
+    from .retention import run_retention
+    from .scheduler import LeaseKeeper, claim_due, pick_due, record_outcomes, release_leases
+    from .snapshots import write_snapshots
+
+    tz = ZoneInfo("America/Toronto")
+    progress = progress or RefreshProgress()
     eng = get_engine()
-    return insert_or_ignore(eng, all_rows)
+    started = datetime.now(timezone.utc)
+    if claimed is not None:
+        facilities = claimed
+    else:
+        ensure_facilities(eng)
+        facilities = db_facilities(eng, unleased_at=started)
+    if budget_seconds is None:
+        budget_seconds = settings.app.refresh_budget_seconds or None
+    if max_facilities is None:
+        max_facilities = settings.app.refresh_max_facilities or None
+
+    phases: Dict[str, float] = {}
+    owner, leased, keeper = f"refresh:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}", [], None
+
+    def timed_phase(name: str, fn, *args):
+        # one span and one phase gauge per step; spans are no-ops unless tracing is on
+        t0 = time.perf_counter()
+        with metrics.span(f"refresh.{name}"):
+            out = fn(*args)
+        phases[name] = round(time.perf_counter() - t0, 3)
+        return out
+
+    try:
+        with metrics.span("refresh", all_facilities=all_facilities):
+            if claimed is not None:
+                due = facilities
+            else:
+                def lease() -> List[Facility]:
+                    limit = None if all_facilities else max_facilities
+                    leased[:] = claim_due(eng, owner, started, limit, due_only=not all_facilities)
+                    mine = db_facilities(eng, ids=leased)
+                    return mine if all_facilities else pick_due(eng, mine, started)
+                due = timed_phase("pick_due", lease)
+                if leased:
+                    keeper = LeaseKeeper(eng, owner)
+                    keeper.start()
+            progress.total(facilities=len(facilities), due=len(due))
+            if not due:
+                return {"due": 0}
+            cache = FetchCache()
+            strategies = FetchStrategies(eng)
+            deadline = time.monotonic() + budget_seconds if budget_seconds else None
+            writer = RowWriter(eng)
+
+            async def pipeline() -> None:
+                # rows are written while later facilities are still being fetched
+                write_task = asyncio.create_task(writer.run())
+                try:
+                    await collect_all(due, tz, cache, progress, deadline, sink=writer.put, strategies=strategies)
+                finally:
+                    await writer.close()
+                    await write_task
+
+            timed_phase("collect", asyncio.run, pipeline())
+            summary: Dict[str, Any] = dict(writer.stats)
+            # pages that didn't change were never parsed; their rows are still current
+            summary["touched"] = timed_phase("touch_last_seen", touch_last_seen, eng, cache.unchanged, datetime.now(tz))
+            summary["fetch_cache"] = cache.stats()
+            cache.save()  # only once the rows it vouches for are stored
+            strategies.save()
+            summary["fetch_tiers"] = strategies.stats()  # "browser": pages that needed Chromium
+            summary["schedule"] = timed_phase("schedule", record_outcomes, eng, due,
+                                              progress.snapshot()["facilities"], cache, started)
+            if settings.app.retention_enabled:
+                # after the schedule (it reads last_success), before the bump (readers see the pruned table)
+                try:
+                    summary["retention"] = timed_phase("retention", run_retention, eng)
+                except Exception:  # the hot table just stays bigger until next run
+                    log.exception("archiving old drop-ins failed")
+            # readers key their caches on this; bump only after the data is in
+            summary["generation"] = timed_phase("bump_generation", bump_generation, eng)
+            try:
+                summary["snapshots"] = timed_phase("snapshots", write_snapshots, eng, summary["generation"], tz)
+            except Exception:  # the web process renders dynamically without them
+                log.exception("writing day snapshots failed")
+            summary["due"] = len(due)
+            summary["found"] = writer.found
+            summary["flushes"] = writer.flushes
+            summary["seconds"] = dict(phases, write=round(writer.write_seconds, 3))
+            progress.total(**summary)
+            return summary
+    finally:
+        if keeper is not None:
+            keeper.stopped.set()
+            keeper.join()
+        release_leases(eng, owner, leased)
+        if claimed is None:  # app.worker keeps its pool across rounds and shuts it down on exit
+            parse_pool.shutdown()
+        metrics.record_phases(phases)
+        metrics.write_refresh_textfile()
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Crawl due facilities and upsert their drop-ins.")
+    ap.add_argument("--budget-seconds", type=float, default=None, help="stop starting new facilities after this long")
+    ap.add_argument("--max-facilities", type=int, default=None, help="crawl at most this many due facilities")
+    ap.add_argument("--all", action="store_true", help="ignore the schedule and crawl everything")
+    args = ap.parse_args()
+    logging.basicConfig(level=settings.app.log_level)
+    print(json.dumps(run_refresh(budget_seconds=args.budget_seconds, max_facilities=args.max_facilities,
+                                 all_facilities=args.all), default=str))
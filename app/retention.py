@@ -0,0 +1,132 @@
+# app/retention.py
+from __future__ import annotations
+import json, logging, time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from .db import _COLS, get_engine
+from .settings import settings
+
+# Keeps `dropins` sized to the near-term schedule: rows for days that are
+# over, and rows a facility's latest crawls no longer list, move to
+# dropins_archive in short batches (one small transaction each, so readers and
+# the refresh writer never wait long). Runs at the end of every refresh and
+# as `python -m app.retention`.
+
+log = logging.getLogger(__name__)
+
+_COLS_SQL = ", ".join(_COLS)
+
+
+def _used_bytes(engine: Engine) -> Optional[int]:
+    with engine.begin() as c:
+        if engine.dialect.name == "postgresql":
+            return int(c.execute(text("SELECT pg_total_relation_size('dropins')")).scalar())
+        if engine.dialect.name == "sqlite":
+            # whole file minus free pages: what deletes actually give back for reuse
+            page_size = c.execute(text("PRAGMA page_size")).scalar()
+            pages = c.execute(text("PRAGMA page_count")).scalar()
+            free = c.execute(text("PRAGMA freelist_count")).scalar()
+            return int((pages - free) * page_size)
+    return None
+
+
+def _hot_rows(engine: Engine) -> int:
+    with engine.begin() as c:
+        return int(c.execute(text("SELECT COUNT(*) FROM dropins")).scalar())
+
+
+def _move_batch(engine: Engine, where: str, params: Dict[str, Any], reason: str, now: datetime, limit: int) -> int:
+    skip_locked = " FOR UPDATE SKIP LOCKED" if engine.dialect.name == "postgresql" else ""
+    with engine.begin() as c:
+        ids = [r[0] for r in c.execute(
+            text(f"SELECT id FROM dropins WHERE {where} ORDER BY start_datetime LIMIT :lim{skip_locked}"),
+            dict(params, lim=limit),
+        )]
+        if not ids:
+            return 0
+        c.execute(
+            text(f"INSERT INTO dropins_archive ({_COLS_SQL}, archived_at, archive_reason) "
+                 f"SELECT {_COLS_SQL}, :now, :reason FROM dropins WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"now": now, "reason": reason, "ids": ids},
+        )
+        c.execute(text(f"DELETE FROM dropins WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                  {"ids": ids})
+    return len(ids)
+
+
+def _move_all(engine: Engine, where: str, params: Dict[str, Any], reason: str, now: datetime) -> int:
+    batch = settings.app.retention_batch_size
+    moved = 0
+    while True:
+        n = _move_batch(engine, where, params, reason, now, batch)
+        moved += n
+        if n < batch:
+            return moved
+        if settings.app.retention_pause_seconds:
+            time.sleep(settings.app.retention_pause_seconds)
+
+
+def _count(engine: Engine, where: str, params: Dict[str, Any]) -> int:
+    with engine.begin() as c:
+        return int(c.execute(text(f"SELECT COUNT(*) FROM dropins WHERE {where}"), params).scalar())
+
+
+def _plan(engine: Engine, now: datetime, tz: ZoneInfo) -> List[tuple]:
+    """(reason, where, params) for every slice of rows due for the archive."""
+    from .scheduler import load_state
+    midnight = datetime(now.year, now.month, now.day, tzinfo=tz)
+    plan = [("past", "start_datetime < :cutoff",
+             {"cutoff": midnight - timedelta(days=settings.app.retention_keep_past_days)})]
+    crawls = settings.app.retention_unseen_crawls
+    if crawls > 0:
+        unseen_cutoff = now - timedelta(minutes=settings.app.crawl_interval_minutes * crawls)
+        for fid, st in load_state(engine).items():
+            if st["last_success"] is None:
+                continue
+            # only facilities crawled successfully since: a failing crawl proves nothing
+            cutoff = min(unseen_cutoff, st["last_success"].astimezone(tz))
+            plan.append(("unseen", "facility_id = :fid AND last_seen < :cutoff", {"fid": fid, "cutoff": cutoff}))
+    return plan
+
+
+def run_retention(engine: Engine | None = None, now: datetime | None = None, dry_run: bool = False) -> Dict[str, Any]:
+    engine = engine or get_engine()
+    tz = ZoneInfo(settings.app.toronto_tz)
+    # local time: "past" cutoffs are counted from local midnight
+    now = (now or datetime.now(tz)).astimezone(tz)
+    rows_before, bytes_before = _hot_rows(engine), _used_bytes(engine)
+    moved: Dict[str, int] = {"past": 0, "unseen": 0}
+    for reason, where, params in _plan(engine, now, tz):
+        moved[reason] += _count(engine, where, params) if dry_run else _move_all(engine, where, params, reason, now)
+    report: Dict[str, Any] = {"dry_run": dry_run, "archived": moved, "hot_rows_before": rows_before}
+    if dry_run:
+        return report
+
+    total = sum(moved.values())
+    if total and engine.dialect.name == "postgresql":
+        # plain VACUUM: no exclusive lock; frees the dead tuples for reuse and refreshes stats
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+            c.execute(text("VACUUM (ANALYZE) dropins"))
+    bytes_after = _used_bytes(engine)
+    report["hot_rows_after"] = _hot_rows(engine)
+    report["bytes_before"], report["bytes_after"] = bytes_before, bytes_after
+    if engine.dialect.name == "sqlite":
+        report["reclaimed_bytes"] = max(0, bytes_before - bytes_after)
+    elif bytes_before and rows_before:
+        # Postgres keeps the file size and reuses the space; estimate from average row size
+        report["reclaimed_bytes"] = int(bytes_before / rows_before * total)
+    log.info("retention archived %s, reclaimed ~%s bytes", moved, report.get("reclaimed_bytes"))
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Move past and no-longer-listed drop-ins to dropins_archive.")
+    ap.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = ap.parse_args()
+    logging.basicConfig(level=settings.app.log_level)
+    print(json.dumps(run_retention(dry_run=args.dry_run), default=str))
@@ -0,0 +1,200 @@
+# app/scheduler.py
+from __future__ import annotations
+import logging, random, threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from .db import as_datetime
+from .settings import settings
+
+# Each facility carries its own crawl clock in facility_state, so refresh can
+# run every few minutes and only touch what is due instead of crawling the
+# whole city in one nightly batch.
+
+log = logging.getLogger(__name__)
+
+_UPSERT_SQL = """
+INSERT INTO facility_state
+    (facility_id, last_attempt, last_success, last_changed, last_hash, failure_count, next_due)
+VALUES (:facility_id, :last_attempt, :last_success, :last_changed, :last_hash, :failure_count, :next_due)
+ON CONFLICT (facility_id) DO UPDATE SET
+    last_attempt = excluded.last_attempt,
+    last_success = excluded.last_success,
+    last_changed = excluded.last_changed,
+    last_hash = excluded.last_hash,
+    failure_count = excluded.failure_count,
+    next_due = excluded.next_due
+"""
+
+
+def load_state(engine: Engine) -> Dict[str, Dict[str, Any]]:
+    with engine.begin() as c:
+        rows = c.execute(text("SELECT * FROM facility_state")).mappings().all()
+    out = {}
+    for r in rows:
+        d = dict(r)
+        for k in ("last_attempt", "last_success", "last_changed", "next_due"):
+            d[k] = as_datetime(d[k])
+        out[d["facility_id"]] = d
+    return out
+
+
+def _changed_recently(st: Dict[str, Any], now: datetime) -> bool:
+    return st.get("last_changed") is not None and \
+        now - st["last_changed"] < timedelta(minutes=settings.app.crawl_interval_minutes)
+
+
+def pick_due(engine: Engine, facilities: List, now: datetime, limit: Optional[int] = None) -> List:
+    """
+    Facilities whose next_due has passed, never-crawled first, then those
+    whose pages changed recently, then stalest last_success first.
+    """
+    state = load_state(engine)
+    epoch = datetime.min.replace(tzinfo=timezone.utc)
+    due = []
+    for fac in facilities:
+        st = state.get(fac.facility_id)
+        if st is None or st["next_due"] is None:
+            due.append(((0, 0, epoch), fac))
+        elif st["next_due"] <= now:
+            due.append(((1, 0 if _changed_recently(st, now) else 1, st["last_success"] or epoch), fac))
+    due.sort(key=lambda x: x[0])
+    facs = [fac for _, fac in due]
+    return facs[:limit] if limit else facs
+
+
+def _outcome(stages: Dict[str, Dict[str, Any]]) -> str:
+    statuses = {s.get("status") for s in stages.values()}
+    if "failed" in statuses:
+        return "failed"
+    if "done" in statuses:
+        return "done"
+    return "deferred"  # budget ran out before any of its fetches started
+
+
+def _jittered(minutes: float) -> timedelta:
+    # +-10% so facilities crawled together drift apart instead of clumping
+    return timedelta(minutes=minutes * random.uniform(0.9, 1.1))
+
+
+def record_outcomes(
+    engine: Engine, facilities: List, progress: Dict[str, Dict[str, Any]], cache, now: datetime
+) -> Dict[str, int]:
+    """
+    Write each attempted facility's new schedule from the run's progress map.
+    Deferred facilities keep their old state, so they stay due for next run.
+    """
+    state = load_state(engine)
+    counts = {"done": 0, "failed": 0, "deferred": 0, "changed": 0}
+    params = []
+    for fac in facilities:
+        stages = progress.get(fac.facility_id, {})
+        no_sources = not (fac.active_search_url or fac.dropin_page_url)
+        outcome = "done" if no_sources and not stages else _outcome(stages)
+        counts[outcome] += 1
+        if outcome == "deferred":
+            continue
+        st = state.get(fac.facility_id) or {"last_success": None, "last_changed": None,
+                                            "last_hash": None, "failure_count": 0}
+        row = dict(st, facility_id=fac.facility_id, last_attempt=now)
+        if outcome == "failed":
+            row["failure_count"] = st["failure_count"] + 1
+            backoff = settings.app.crawl_failure_backoff_minutes * 2 ** (row["failure_count"] - 1)
+            row["next_due"] = now + _jittered(min(backoff, settings.app.crawl_interval_minutes))
+        else:
+            h = cache.facility_hash(fac.facility_id) if cache is not None else None
+            if h is not None and h != st["last_hash"]:
+                row["last_changed"] = now
+                row["last_hash"] = h
+                counts["changed"] += 1
+            row["last_success"] = now
+            row["failure_count"] = 0
+            interval = settings.app.crawl_interval_changed_minutes if _changed_recently(row, now) \
+                else settings.app.crawl_interval_minutes
+            row["next_due"] = now + _jittered(interval)
+        params.append({k: row[k] for k in ("facility_id", "last_attempt", "last_success", "last_changed",
+                                            "last_hash", "failure_count", "next_due")})
+    if params:
+        with engine.begin() as c:
+            c.execute(text(_UPSERT_SQL), params)
+    return counts
+
+
+# Leases let several workers (app.worker) share the schedule: a claim marks
+# due facilities as theirs until lease_expires, the heartbeat pushes that
+# out, and a crashed worker's facilities become claimable again once it
+# lapses. One UPDATE ... RETURNING per claim; on Postgres the candidate rows
+# are locked with SKIP LOCKED so concurrent claims never wait on each other,
+# on SQLite the single write lock serializes them. A plain run_refresh takes
+# leases the same way, so cron and workers can run side by side.
+
+_CLAIM_SQL = """
+UPDATE facilities SET lease_owner = :owner, lease_expires = :expires
+WHERE facility_id IN (
+    SELECT f.facility_id FROM facilities f
+    LEFT JOIN facility_state s ON s.facility_id = f.facility_id
+    WHERE (f.lease_expires IS NULL OR f.lease_expires < :now){due}
+    ORDER BY CASE WHEN s.next_due IS NULL THEN 0 ELSE 1 END,
+             CASE WHEN s.last_changed >= :changed_since THEN 0 ELSE 1 END,
+             CASE WHEN s.last_success IS NULL THEN 0 ELSE 1 END, s.last_success
+    {limit}{lock}
+)
+RETURNING facility_id
+"""
+
+
+def claim_due(engine: Engine, owner: str, now: datetime, limit: Optional[int] = None,
+              due_only: bool = True) -> List[str]:
+    """Lease up to `limit` due (any, without due_only) unleased facilities to `owner`; returns their ids."""
+    sql = _CLAIM_SQL.format(
+        due="\n      AND (s.next_due IS NULL OR s.next_due <= :now)" if due_only else "",
+        limit="LIMIT :limit" if limit else "",
+        lock=" FOR UPDATE OF f SKIP LOCKED" if engine.dialect.name == "postgresql" else "",
+    )
+    params = {
+        "owner": owner, "now": now,
+        "expires": now + timedelta(seconds=settings.app.worker_lease_seconds),
+        "changed_since": now - timedelta(minutes=settings.app.crawl_interval_minutes),
+    }
+    if limit:
+        params["limit"] = limit
+    with engine.begin() as c:
+        return [r[0] for r in c.execute(text(sql), params)]
+
+
+def renew_leases(engine: Engine, owner: str, now: datetime) -> int:
+    with engine.begin() as c:
+        res = c.execute(
+            text("UPDATE facilities SET lease_expires = :expires WHERE lease_owner = :owner"),
+            {"owner": owner, "expires": now + timedelta(seconds=settings.app.worker_lease_seconds)},
+        )
+    return res.rowcount or 0
+
+
+def release_leases(engine: Engine, owner: str, ids: List[str]) -> None:
+    if not ids:
+        return
+    with engine.begin() as c:
+        c.execute(
+            text("UPDATE facilities SET lease_owner = NULL, lease_expires = NULL "
+                 "WHERE lease_owner = :owner AND facility_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"owner": owner, "ids": ids},
+        )
+
+
+class LeaseKeeper(threading.Thread):
+    """Renews `owner`'s leases every worker_heartbeat_seconds until stopped."""
+
+    def __init__(self, engine: Engine, owner: str):
+        super().__init__(daemon=True)
+        self.engine, self.owner = engine, owner
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(settings.app.worker_heartbeat_seconds):
+            try:
+                renew_leases(self.engine, self.owner, datetime.now(timezone.utc))
+            except Exception:
+                log.exception("lease heartbeat for %s failed", self.owner)
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import List
 
 class AppSettings(BaseSettings):
     db_url: str = Field(default="sqlite:///./data.sqlite3")
@@ -8,10 +9,58 @@ class AppSettings(BaseSettings):
     request_timeout_seconds: int = Field(default=20)
     polite_delay_seconds_min: float = Field(default=1.0)
     polite_delay_seconds_max: float = 2.0
+    db_pool_size: int = Field(default=5)
+    db_max_overflow: int = Field(default=10)
+    db_pool_timeout_seconds: float = Field(default=10.0)
+    db_pool_recycle_seconds: int = Field(default=1800)
+    sqlite_mmap_bytes: int = Field(default=268435456)
+    sqlite_cache_kib: int = Field(default=65536)
+    sqlite_busy_timeout_ms: int = Field(default=5000)
+    sqlite_readonly_web: bool = Field(default=True)
+    browser_pool_size: int = Field(default=4)
+    browser_load_profile: str = Field(default="light")
+    browser_blocked_resources: List[str] = Field(default=["image", "media", "font"])
+    browser_blocked_hosts: List[str] = Field(default=[
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+        "facebook.net", "hotjar.com", "nr-data.net", "newrelic.com",
+    ])
+    dropin_page_selector: str = Field(default="")
+    browser_selector_timeout_seconds: float = Field(default=5.0)
+    fetch_reprobe_hours: float = Field(default=168)
+    http_max_connections: int = Field(default=10)
+    http_retries: int = Field(default=3)
+    http_backoff_seconds: float = Field(default=1.0)
+    parse_workers: int = Field(default=0)
+    cache_max_entries: int = Field(default=512)
+    generation_check_seconds: float = Field(default=2.0)
+    job_heartbeat_seconds: float = Field(default=2.0)
+    job_stale_seconds: int = Field(default=120)
+    crawl_interval_minutes: int = Field(default=1440)
+    crawl_interval_changed_minutes: int = Field(default=360)
+    crawl_failure_backoff_minutes: int = Field(default=15)
+    worker_batch_size: int = Field(default=20)
+    worker_lease_seconds: int = Field(default=600)
+    worker_heartbeat_seconds: float = Field(default=60.0)
+    worker_idle_seconds: float = Field(default=30.0)
+    refresh_budget_seconds: float = Field(default=0)
+    refresh_max_facilities: int = Field(default=0)
+    write_queue_size: int = Field(default=8)
+    write_batch_rows: int = Field(default=500)
+    write_flush_seconds: float = Field(default=2.0)
+    snapshot_days: int = Field(default=14)
+    retention_enabled: bool = Field(default=True)
+    retention_keep_past_days: int = Field(default=1)
+    retention_unseen_crawls: int = Field(default=3)
+    retention_batch_size: int = Field(default=1000)
+    retention_pause_seconds: float = Field(default=0.05)
+    tracing_enabled: bool = Field(default=False)
     log_level: str = Field(default="INFO")
 
 class PathSettings(BaseSettings):
     facilities_file: str = Field(default="./facilities.json")
+    fetch_cache_file: str = Field(default="./.cache/fetch_cache.json")
+    snapshot_dir: str = Field(default="./.cache/snapshots")
+    metrics_textfile: str = Field(default="./.cache/refresh_metrics.prom")
 
 class Settings(BaseSettings):
     app: AppSettings = AppSettings()
@@ -0,0 +1,93 @@
+# app/snapshots.py
+from __future__ import annotations
+import gzip, importlib.util, json, os, shutil
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from .db import DAY_SQL, day_bounds, decode_row
+from .settings import settings
+
+# Refresh renders the next `snapshot_days` day views (HTML and JSON) into
+# <snapshot_dir>/<generation>/, each with .gz and .br siblings, so the web
+# process can answer them with a file read instead of a query + render.
+# A generation directory is published with one rename; the web side falls
+# back to dynamic rendering whenever the file it wants isn't there.
+
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "app/templates")
+_HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+# preference order when the client accepts several
+ENCODINGS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"), ("identity", ""))
+
+
+def day_context(selected: date, rows: List[Dict[str, Any]], tz: ZoneInfo) -> Dict[str, Any]:
+    return {"selected": selected.isoformat(), "rows": rows, "tz": tz}
+
+
+def _json_default(v: Any) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return str(v)
+
+
+def day_json(selected: date, rows: List[Dict[str, Any]]) -> bytes:
+    return json.dumps({"day": selected.isoformat(), "rows": rows}, default=_json_default,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def _variants(path: Path, body: bytes) -> None:
+    path.write_bytes(body)
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(body, 9, mtime=0))
+    if _HAS_BROTLI:
+        import brotli
+        path.with_name(path.name + ".br").write_bytes(brotli.compress(body, quality=11))
+
+
+def write_snapshots(engine: Engine, generation: int, tz: ZoneInfo,
+                    days: Optional[int] = None, out_dir: Optional[str] = None) -> Dict[str, Any]:
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    days = settings.app.snapshot_days if days is None else days
+    root = Path(out_dir or settings.paths.snapshot_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f"{generation}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(["html"]))
+    template = env.get_template("home.html")
+    today = datetime.now(tz).date()
+    with engine.begin() as c:
+        for i in range(days):
+            d = today + timedelta(days=i)
+            day_start, next_day_start = day_bounds(d, tz)
+            rows = [decode_row(r._mapping, tz) for r in c.execute(
+                text(DAY_SQL), {"day_start": day_start, "next_day_start": next_day_start})]
+            _variants(tmp / f"home-{d.isoformat()}.html", template.render(day_context(d, rows, tz)).encode("utf-8"))
+            _variants(tmp / f"day-{d.isoformat()}.json", day_json(d, rows))
+
+    final = root / str(generation)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    # keep the previous generation: web workers may still be a clock tick behind
+    for p in root.iterdir():
+        if p.is_dir() and p.name.isdigit() and int(p.name) < generation - 1:
+            shutil.rmtree(p, ignore_errors=True)
+    return {"days": days, "dir": str(final), "brotli": _HAS_BROTLI}
+
+
+def find(name: str, generation: int, accept_encoding: str) -> Optional[Tuple[Path, str]]:
+    """Best pre-compressed variant of snapshot `name` the client accepts, if one exists."""
+    base = Path(settings.paths.snapshot_dir) / str(generation) / name
+    accepted = {t.split(";")[0].strip().lower() for t in accept_encoding.split(",")}
+    for encoding, suffix in ENCODINGS:
+        if encoding != "identity" and encoding not in accepted:
+            continue
+        path = base.with_name(base.name + suffix)
+        if path.is_file():
+            return path, encoding
+    return None
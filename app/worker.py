@@ -0,0 +1,79 @@
+# app/worker.py
+from __future__ import annotations
+import json, logging, os, signal, socket, threading, uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy.engine import Engine
+
+from .collectors import parse_pool
+from .db import get_engine
+from .facilities import db_facilities, ensure_facilities
+from .scheduler import LeaseKeeper, claim_due, pick_due, release_leases
+from .settings import settings
+
+# `python -m app.worker` on any number of boxes: each round claims a batch of
+# due facilities through row leases (app.scheduler.claim_due), crawls them
+# with run_refresh, and releases them. A heartbeat keeps the leases alive
+# while it works; if the worker dies they lapse after worker_lease_seconds
+# and another worker picks the facilities up.
+
+log = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def run_round(engine: Engine, owner: str, batch: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Claim, crawl and release one batch; None when nothing was due."""
+    from .refresh import run_refresh
+    now = _now()
+    ids = claim_due(engine, owner, now, batch or settings.app.worker_batch_size)
+    if not ids:
+        return None
+    keeper = LeaseKeeper(engine, owner)
+    keeper.start()
+    try:
+        # same order a single-process refresh would use
+        claimed = pick_due(engine, db_facilities(engine, ids=ids), now)
+        return run_refresh(claimed=claimed)
+    finally:
+        keeper.stopped.set()
+        keeper.join()
+        release_leases(engine, owner, ids)
+
+
+def run_worker(once: bool = False, batch: Optional[int] = None, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    engine = get_engine()
+    ensure_facilities(engine)
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # finish (and release) the current batch, then exit
+        signal.signal(sig, lambda *_: stop.set())
+    log.info("worker %s started", owner)
+    rounds: List[Dict[str, Any]] = []
+    try:
+        while not stop.is_set():
+            summary = run_round(engine, owner, batch)
+            if summary is not None:
+                rounds.append(summary)
+                log.info("worker %s crawled %s facilities", owner, summary.get("due"))
+            if once:
+                break
+            if summary is None:
+                stop.wait(settings.app.worker_idle_seconds)
+    finally:
+        parse_pool.shutdown()  # one pool for every round of this process
+    return rounds
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Claim and crawl due facilities until stopped.")
+    ap.add_argument("--once", action="store_true", help="one round, then exit")
+    ap.add_argument("--batch", type=int, default=None, help="facilities claimed per round")
+    args = ap.parse_args()
+    logging.basicConfig(level=settings.app.log_level)
+    for r in run_worker(once=args.once, batch=args.batch):
+        print(json.dumps(r, default=str))
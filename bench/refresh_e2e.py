@@ -0,0 +1,197 @@
+# bench/refresh_e2e.py
+"""
+Offline end-to-end refresh benchmark.
+
+Generates synthetic Active Communities search pages (and optionally
+"Drop-in Programs" pages) for N facilities, serves them from a local HTTP
+server, and times `python -m app.refresh --all` against a fresh SQLite file.
+Each run is a separate process so its peak RSS can be measured. The first
+run is cold; later runs revalidate against the fetch cache (304s).
+
+    python bench/refresh_e2e.py --facilities 200 --sessions 20 --out bench.json
+"""
+from __future__ import annotations
+import argparse, json, os, platform, subprocess, sys, tempfile, threading, time
+from datetime import date, datetime, timedelta, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def search_page(fid: int, sessions: int, start: date) -> str:
+    cards = []
+    for i in range(sessions):
+        d = start + timedelta(days=i % 28)
+        hour = 6 + i % 4
+        cards.append(
+            f'<li class="activity"><div class="card"><div class="card-body">'
+            f'<h3>Volleyball - Adult Drop-in #{fid}-{i}</h3>'
+            f'<div class="when"><span>{d:%a}, {d:%b} {d.day}, {d.year}</span></div>'
+            f'<div class="time"><span>{hour}:00 PM - {hour + 2}:00 PM</span></div>'
+            f'<div class="age"><span>Ages 19+</span></div>'
+            f'<div class="fee"><span>$4.50</span></div>'
+            f'</div></div></li>'
+        )
+    body = "<ul>" + "".join(cards) + "</ul>"
+    for _ in range(4):
+        body = f'<div class="wrap"><section>{body}</section></div>'
+    return f"<html><head><title>Activity Search</title></head><body>{body}</body></html>"
+
+
+def dropin_page(fid: int, sessions: int, monday: date) -> str:
+    # the assets a real city page drags in; the light load profile never fetches them
+    parts = [f'<link rel="stylesheet" href="/font.css"><img src="/hero.jpg?{fid}" alt="">'
+             f"<h2>Drop-in Programs</h2><p>For the week of {monday.isoformat()}</p>"]
+    per_day = max(1, sessions // 7)
+    for day in DAYS:
+        parts.append(f"<h3>{day}</h3>")
+        for i in range(per_day):
+            hour = 1 + i % 9
+            parts.append(f"<p>Volleyball - Adult #{fid}-{i} {hour}:00 PM - {hour + 1}:30 PM 19+ $5.00</p>")
+            parts.append("<p>Badminton 6:00 PM - 8:00 PM</p>")
+    return "<html><body><main>" + "".join(parts) + "</main></body></html>"
+
+
+def build_site(site: Path, n: int, sessions: int, pages: bool, port: int) -> List[Dict[str, Any]]:
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    facilities = []
+    if pages:
+        (site / "hero.jpg").write_bytes(b"\xff\xd8" + os.urandom(200_000))
+        (site / "font.css").write_text("body{font-family:serif}", encoding="utf-8")
+    for fid in range(n):
+        (site / f"search-{fid}.html").write_text(search_page(fid, sessions, today), encoding="utf-8")
+        fac = {
+            "facility_id": f"bench-{fid}",
+            "facility_name": f"Bench Centre {fid}",
+            "district": ["North", "South", "East", "West"][fid % 4],
+            "address": f"{fid} Bench St",
+            "active_search_url": f"http://127.0.0.1:{port}/search-{fid}.html",
+        }
+        if pages:
+            (site / f"dropin-{fid}.html").write_text(dropin_page(fid, sessions, monday), encoding="utf-8")
+            fac["dropin_page_url"] = f"http://127.0.0.1:{port}/dropin-{fid}.html"
+        facilities.append(fac)
+    return facilities
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+
+def serve(site: Path) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(site)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def read_steps(path: Path) -> Dict[str, Dict[str, float]]:
+    """
+    Per-(source, step) count and total seconds from the refresh metrics
+    textfile, plus "<source>/page_bytes" (count and total bytes per page load).
+    """
+    from prometheus_client.parser import text_string_to_metric_families
+    steps: Dict[str, Dict[str, float]] = {}
+    if not path.exists():
+        return steps
+    for family in text_string_to_metric_families(path.read_text(encoding="utf-8")):
+        if family.name not in ("quickset_refresh_step_seconds", "quickset_refresh_page_bytes"):
+            continue
+        for s in family.samples:
+            kind = s.name.rsplit("_", 1)[-1]
+            if kind in ("count", "sum"):
+                step = s.labels.get("step", "page_bytes")
+                steps.setdefault(f"{s.labels['source']}/{step}", {})[kind] = round(s.value, 4)
+    return steps
+
+
+def run_once(env: Dict[str, str], metrics_file: Path) -> Dict[str, Any]:
+    # logs go to a file: draining two pipes one after the other can deadlock
+    # once the child fills the stderr pipe while we block on stdout
+    with tempfile.TemporaryFile() as errf:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "app.refresh", "--all"], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, stderr=errf)
+        out = proc.stdout.read()
+        _, status, usage = os.wait4(proc.pid, 0)  # rusage of this child alone
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        seconds = time.perf_counter() - t0
+        errf.seek(0)
+        err = errf.read()
+    if proc.returncode != 0:
+        raise RuntimeError(f"refresh exited {proc.returncode}:\n{err.decode(errors='replace')[-2000:]}")
+    summary = json.loads(out.decode().strip().splitlines()[-1])
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"seconds": round(seconds, 3), "peak_rss_mb": round(rss, 1), "summary": summary,
+            "steps": read_steps(metrics_file)}
+
+
+def main(argv: List[str] | None = None) -> Dict[str, Any]:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--facilities", type=int, default=100)
+    ap.add_argument("--sessions", type=int, default=14, help="volleyball sessions per facility page")
+    ap.add_argument("--runs", type=int, default=2, help="first is cold, the rest hit the fetch cache")
+    ap.add_argument("--browser-pages", action="store_true",
+                    help="also serve Drop-in Programs pages (server-rendered, so they are read over plain HTTP)")
+    ap.add_argument("--load-profile", choices=("light", "full"), default="light",
+                    help="browser loading profile for --browser-pages")
+    ap.add_argument("--out", default="bench_refresh.json")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="quickset-bench-") as tmp:
+        tmp_path = Path(tmp)
+        site = tmp_path / "site"
+        site.mkdir()
+        server = serve(site)
+        try:
+            port = server.server_address[1]
+            facilities = build_site(site, args.facilities, args.sessions, args.browser_pages, port)
+            fac_file = tmp_path / "facilities.json"
+            fac_file.write_text(json.dumps(facilities), encoding="utf-8")
+            metrics_file = tmp_path / "refresh_metrics.prom"
+            env = dict(
+                os.environ,
+                APP__DB_URL=f"sqlite:///{tmp_path / 'bench.sqlite3'}",
+                PATHS__FACILITIES_FILE=str(fac_file),
+                PATHS__FETCH_CACHE_FILE=str(tmp_path / "fetch_cache.json"),
+                PATHS__METRICS_TEXTFILE=str(metrics_file),
+                PATHS__SNAPSHOT_DIR=str(tmp_path / "snapshots"),
+                # one local host: the politeness delay would measure nothing but sleep
+                APP__POLITE_DELAY_SECONDS_MIN="0",
+                APP__POLITE_DELAY_SECONDS_MAX="0",
+                APP__BROWSER_LOAD_PROFILE=args.load_profile,
+                LOG_LEVEL="WARNING",
+                APP__LOG_LEVEL="WARNING",
+            )
+            runs = []
+            for i in range(args.runs):
+                r = run_once(env, metrics_file)
+                r["name"] = "cold" if i == 0 else f"warm{i}"
+                r["facilities_per_sec"] = round(args.facilities / r["seconds"], 2)
+                r["rows_per_sec"] = round(r["summary"].get("found", 0) / r["seconds"], 1)
+                runs.append(r)
+        finally:
+            server.shutdown()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "runs": runs,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for r in runs:
+        print(f"{r['name']:>6}: {r['seconds']:.2f}s  {r['facilities_per_sec']} fac/s  "
+              f"{r['rows_per_sec']} rows/s  peak {r['peak_rss_mb']} MB")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import pytest
+from sqlalchemy import create_engine
+from app.db import _init_schema
+
+TZ = ZoneInfo("America/Toronto")
+
+def _dropin_row(hour, fee=5.0, seen=None):
+    start = datetime(2025, 9, 2, hour, 0, tzinfo=TZ)
+    return {
+        "facility_id": "trinity", "facility_name": "Trinity", "district": "South",
+        "address": "155 Crawford St", "program_name": "Volleyball Drop-in",
+        "age_min": 19, "age_max": None, "weekday": 1,
+        "start_datetime": start, "end_datetime": start + timedelta(hours=2),
+        "fee_cad": fee, "reserve_required": False, "source_url": "https://example.com",
+        "last_seen": seen or datetime(2025, 9, 1, 2, 30, tzinfo=TZ),
+    }
+
+@pytest.fixture
+def engine(tmp_path):
+    """A migrated SQLite file of its own for each test."""
+    eng = create_engine(f"sqlite:///{tmp_path / 'test.sqlite3'}")
+    _init_schema(eng)
+    yield eng
+    eng.dispose()
+
+@pytest.fixture
+def dropin_row():
+    """Factory for a Trinity dropins row: dropin_row(hour, fee=5.0, seen=None) on 2025-09-02."""
+    return _dropin_row
@@ -0,0 +1,41 @@
+from zoneinfo import ZoneInfo
+import pytest
+from app.collectors.common import Facility
+from app.collectors.active_communities import parse_active_html
+
+pytest.importorskip("pytest_benchmark")
+
+TZ = ZoneInfo("America/Toronto")
+FAC = Facility("trinity", "Trinity", "Toronto & East York", "155 Crawford St", active_search_url="https://x/search")
+
+def _search_page(cards: int, depth: int = 6) -> str:
+    # results nested a few wrappers deep, like the real Active Net markup
+    items = []
+    for i in range(cards):
+        day = 1 + i % 28
+        items.append(
+            f'<li class="activity"><div class="card"><div class="card-body">'
+            f'<h3>Volleyball - Adult Drop-in #{i}</h3>'
+            f'<div class="when"><span>Tue, Sep {day}, 2025</span></div>'
+            f'<div class="time"><span>7:00 PM - 9:00 PM</span></div>'
+            f'<div class="age"><span>Ages 19+</span></div>'
+            f'<div class="fee"><span>$4.50</span></div>'
+            f'</div></div></li>'
+        )
+    body = "<ul>" + "".join(items) + "</ul>"
+    for _ in range(depth):
+        body = f'<div class="wrap"><section>{body}</section></div>'
+    return f"<html><head><script>var volleyball = 1;</script></head><body>{body}</body></html>"
+
+def test_active_cards_are_emitted_once():
+    rows = parse_active_html(_search_page(50), FAC, TZ)
+    assert len(rows) == 50
+    assert len({r["program_name"] for r in rows}) == 50
+
+def test_bench_parse_active_cards(benchmark):
+    cards = 2000
+    html = _search_page(cards)
+    rows = benchmark.pedantic(parse_active_html, args=(html, FAC, TZ), rounds=3, iterations=1)
+    assert len(rows) == cards
+    benchmark.extra_info["cards"] = cards
+    benchmark.extra_info["us_per_card"] = round(benchmark.stats.stats.mean / cards * 1e6, 2)
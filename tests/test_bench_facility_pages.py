@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+import pytest
+from app.collectors.common import Facility
+from app.collectors.facility_pages import parse_dropin_html
+
+pytest.importorskip("pytest_benchmark")
+
+TZ = ZoneInfo("America/Toronto")
+FAC = Facility("trinity", "Trinity", "Toronto & East York", "155 Crawford St", dropin_page_url="https://x/dropin")
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def _dropin_page(weeks: int, per_day: int, first: date = date(2025, 9, 1)) -> bytes:
+    # several weeks on one page, other programs mixed in, like the city's listings
+    parts = ["<html><head><script>var volleyball = 1;</script></head><body><main><h2>Drop-in Programs</h2>"]
+    for w in range(weeks):
+        parts.append(f"<p>For the week of {(first + timedelta(weeks=w)).isoformat()}</p>")
+        for day in DAYS:
+            parts.append(f"<h3>{day}</h3>")
+            for i in range(per_day):
+                hour = 1 + i % 9
+                parts.append(f"<p><strong>Volleyball - Adult</strong> <span>{hour}:00 PM - {hour + 1}:30 PM</span>"
+                             f" <span>19+</span> <span>$5.00</span></p>")
+                parts.append(f"<p>Badminton {hour}:00 PM - {hour + 2}:00 PM</p>")
+    return ("".join(parts) + "</main></body></html>").encode()
+
+def test_every_week_on_the_page_is_ingested():
+    rows = parse_dropin_html(_dropin_page(3, 2), FAC, TZ)
+    assert len(rows) == 3 * 7 * 2
+    days = sorted({r["start_datetime"].date() for r in rows})
+    assert days[0] == date(2025, 9, 1) and days[-1] == date(2025, 9, 21) and len(days) == 21
+    assert {r["fee_cad"] for r in rows} == {5.0} and {r["age_min"] for r in rows} == {19}
+
+def test_bench_parse_dropin_page(benchmark):
+    weeks, per_day = 3, 60
+    body = _dropin_page(weeks, per_day)
+    rows = benchmark.pedantic(parse_dropin_html, args=(body, FAC, TZ), rounds=3, iterations=1)
+    assert len(rows) == weeks * 7 * per_day
+    benchmark.extra_info["bytes"] = len(body)
+    benchmark.extra_info["us_per_entry"] = round(benchmark.stats.stats.mean / len(rows) * 1e6, 2)
@@ -0,0 +1,16 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
+import refresh_e2e  # noqa: E402
+
+def test_e2e_refresh_bench_smoke(tmp_path):
+    out = tmp_path / "bench.json"
+    report = refresh_e2e.main(["--facilities", "3", "--sessions", "5", "--runs", "2", "--out", str(out)])
+    assert json.loads(out.read_text()) == report
+    cold, warm = report["runs"]
+    assert cold["summary"]["found"] == 15 and cold["summary"]["inserted"] == 15
+    assert warm["summary"]["fetch_cache"]["hits"] == 3 and warm["summary"]["found"] == 0
+    assert cold["steps"]["active/parse"]["count"] == 3
+    assert cold["peak_rss_mb"] > 0 and cold["rows_per_sec"] > 0
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+from app.cache import ResponseCache, make_etag, not_modified, validator_headers
+
+def test_response_cache_lru_bound():
+    cache = ResponseCache(maxsize=2)
+    builds = []
+    def build(v):
+        return lambda: builds.append(v) or v
+    assert cache.get_or_build(("home", 1), build(b"a")) == b"a"
+    assert cache.get_or_build(("home", 1), build(b"x")) == b"a"   # hit
+    cache.get_or_build(("home", 2), build(b"b"))
+    cache.get_or_build(("home", 3), build(b"c"))                  # evicts 1
+    assert cache.get_or_build(("home", 1), build(b"a2")) == b"a2"
+    assert builds == [b"a", b"b", b"c", b"a2"]
+
+def test_conditional_headers():
+    updated = datetime(2025, 9, 2, 6, 30, 15, 123, tzinfo=timezone.utc)
+    etag = make_etag("home", {"day": "2025-09-02"}, 7)
+    assert etag != make_etag("home", {"day": "2025-09-02"}, 8)
+    hdrs = validator_headers(etag, updated)
+    assert not_modified({"if-none-match": f'W/{etag}, "other"'}, etag, updated)
+    assert not not_modified({"if-none-match": '"other"'}, etag, updated)
+    assert not_modified({"if-modified-since": hdrs["Last-Modified"]}, etag, updated)
+    assert not not_modified({}, etag, updated)
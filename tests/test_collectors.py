@@ -0,0 +1,217 @@
+from app.collectors.fetch_cache import FetchCache
+
+def test_fetch_cache_roundtrip(tmp_path):
+    path = tmp_path / "fetch_cache.json"
+    cache = FetchCache(str(path))
+    assert not cache.is_unchanged("trinity", "https://x/search", 200, b"<html>v1</html>")
+    cache.store("trinity", "https://x/search", b"<html>v1</html>", {"etag": '"abc"'})
+    cache.save()
+
+    cache = FetchCache(str(path))
+    assert cache.conditional_headers("trinity", "https://x/search") == {"If-None-Match": '"abc"'}
+    assert cache.is_unchanged("trinity", "https://x/search", 304)
+    assert cache.is_unchanged("trinity", "https://x/search", 200, b"<html>v1</html>")
+    assert not cache.is_unchanged("trinity", "https://x/search", 200, b"<html>v2</html>")
+    # same URL, different facility: never parsed for it yet
+    assert not cache.is_unchanged("other", "https://x/search", 200, b"<html>v1</html>")
+    assert cache.stats() == {"hits": 2, "misses": 2}
+    assert cache.unchanged == {("trinity", "https://x/search")}
+
+def test_fetch_cache_undated_page_expires_with_the_week(tmp_path):
+    cache = FetchCache(str(tmp_path / "fetch_cache.json"))
+    cache.store("gym", "https://x/dropin", b"<h3>Monday</h3>", week="2025-09-01")
+    assert cache.is_unchanged("gym", "https://x/dropin", 200, b"<h3>Monday</h3>", "2025-09-01")
+    # same bytes, but its rows were dated from last week: parse again
+    assert not cache.is_unchanged("gym", "https://x/dropin", 200, b"<h3>Monday</h3>", "2025-09-08")
+    assert not cache.is_unchanged("gym", "https://x/dropin", 304, week="2025-09-08")
+
+def test_get_with_retries_backs_off_on_503(monkeypatch):
+    import asyncio
+    import httpx
+    from app.collectors import http as http_mod
+    from app.collectors.throttle import HostThrottle
+
+    calls = []
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503 if len(calls) < 3 else 200, text="ok")
+
+    monkeypatch.setattr(http_mod.settings.app, "http_backoff_seconds", 0.0)
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await http_mod.get_with_retries(client, "https://city.example/search", HostThrottle(0, 0))
+    resp = asyncio.run(go())
+    assert resp.status_code == 200 and len(calls) == 3
+
+def test_light_profile_blocks_assets_and_trackers():
+    from app.collectors.facility_pages import _should_block
+    assert _should_block("image", "https://www.toronto.ca/hero.jpg")
+    assert _should_block("script", "https://www.googletagmanager.com/gtm.js")
+    assert not _should_block("script", "https://www.toronto.ca/app.js")
+    assert not _should_block("document", "https://www.toronto.ca/drop-in")
+
+def test_browser_fetch_waits_for_the_schedule(monkeypatch):
+    import asyncio
+    from app.collectors.facility_pages import BrowserPool
+    from app.collectors.throttle import HostThrottle
+    from app.settings import settings
+
+    class _Page:
+        def __init__(self, appears=True):
+            self.calls, self.appears = [], appears
+        async def goto(self, url, wait_until, timeout):
+            self.calls.append(("goto", wait_until))
+        async def wait_for_selector(self, selector, state, timeout):
+            self.calls.append(("wait", selector, state))
+            if not self.appears:
+                raise TimeoutError(selector)
+        async def content(self):
+            return "<html>schedule</html>"
+
+    async def fetch(page, selector=None):
+        pool = BrowserPool(size=1, throttle=HostThrottle(0, 0))
+        pool._idle.append(page)
+        return await pool.fetch("https://city.example/dropin", selector)
+
+    monkeypatch.setattr(settings.app, "browser_load_profile", "light")
+    monkeypatch.setattr(settings.app, "dropin_page_selector", "")
+    page = _Page()
+    assert asyncio.run(fetch(page)) == "<html>schedule</html>"
+    assert page.calls == [("goto", "networkidle")]  # nothing to wait for: let scripts finish
+
+    page = _Page()
+    asyncio.run(fetch(page, "#schedule"))
+    assert page.calls == [("goto", "domcontentloaded"), ("wait", "#schedule", "attached")]
+
+    page = _Page(appears=False)  # a stale selector still yields the page
+    assert asyncio.run(fetch(page, "#schedule")) == "<html>schedule</html>"
+
+    monkeypatch.setattr(settings.app, "browser_load_profile", "full")
+    page = _Page()
+    asyncio.run(fetch(page, "#schedule"))
+    assert page.calls == [("goto", "networkidle")]
+
+def test_facility_page_http_first_then_browser(engine, monkeypatch):
+    import asyncio
+    from datetime import timedelta
+    from zoneinfo import ZoneInfo
+    import httpx
+    from app.collectors.common import Facility
+    from app.collectors.facility_pages import collect_from_dropin_page_async
+    from app.collectors.fetch_strategy import FetchStrategies
+    from app.collectors.throttle import HostThrottle
+    from app.settings import settings
+
+    monkeypatch.setattr(settings.app, "http_backoff_seconds", 0.0)
+    served = ("<h2>Drop-in Programs</h2><p>For the week of September 1, 2025</p>"
+              "<h3>Monday</h3><p>Volleyball - Adult 7:00 PM - 9:00 PM 19+ $5.00</p>")
+    pages = {"/served": served, "/spa": "<div id='app'></div>"}
+
+    def handler(request):
+        if request.url.path == "/reset":
+            raise httpx.ConnectError("connection reset by peer", request=request)
+        return httpx.Response(200, text=pages[request.url.path])
+    rendered = []
+
+    class _Pool:
+        throttle = HostThrottle(0, 0)
+        async def fetch(self, url, selector=None):
+            rendered.append(url)
+            return served
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    facs = [Facility(f, f, "", "", dropin_page_url=f"https://city.example/{f}") for f in ("served", "spa", "reset")]
+
+    async def run(strategies):
+        return [await collect_from_dropin_page_async(f, ZoneInfo("America/Toronto"), _Pool(), None, client, strategies)
+                for f in facs]
+
+    strategies = FetchStrategies(engine)
+    rows = asyncio.run(run(strategies))
+    assert [len(r) for r in rows] == [1, 1, 1]
+    assert rendered == ["https://city.example/spa", "https://city.example/reset"]
+    assert strategies.stats() == {"http": 1, "browser": 2}
+    strategies.save()
+
+    again = FetchStrategies(engine)
+    assert again.try_http("https://city.example/served") and not again.try_http("https://city.example/spa")
+    assert not again.try_http("https://city.example/reset")
+    assert FetchStrategies(engine, now=again.now + timedelta(days=8)).try_http("https://city.example/spa")
+
+def test_undated_page_week_rollover_refetches_over_http(engine, tmp_path, monkeypatch):
+    import asyncio
+    from datetime import date, timedelta
+    from zoneinfo import ZoneInfo
+    import httpx
+    from app.collectors import facility_pages
+    from app.collectors.common import Facility
+    from app.collectors.fetch_strategy import FetchStrategies
+    from app.collectors.throttle import HostThrottle
+
+    # "week of" is there (so it reads over HTTP) but doesn't parse: rows are dated from the current week
+    page = ("<h2>Drop-in Programs</h2><p>For the week of TBD</p>"
+            "<h3>Monday</h3><p>Volleyball - Adult 7:00 PM - 9:00 PM 19+ $5.00</p>")
+    sent = []
+
+    def handler(request):
+        sent.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=page, headers={"etag": '"v1"'})
+
+    class _Pool:
+        throttle = HostThrottle(0, 0)
+        async def fetch(self, url, selector=None):
+            raise AssertionError("an HTTP-readable page must not be rendered")
+
+    tz = ZoneInfo("America/Toronto")
+    fac = Facility("gym", "Gym", dropin_page_url="https://city.example/gym")
+    cache = FetchCache(str(tmp_path / "fetch_cache.json"))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    strategies = FetchStrategies(engine)
+
+    def run(monday):
+        monkeypatch.setattr(facility_pages, "current_week", lambda tz: monday)
+        return asyncio.run(facility_pages.collect_from_dropin_page_async(fac, tz, _Pool(), cache, client, strategies))
+
+    this_week = date(2025, 9, 1)
+    assert run(this_week)[0]["start_datetime"].date() == this_week
+    assert run(this_week) == []  # same week: the 304 is a hit
+    rows = run(this_week + timedelta(days=7))  # rolled over: no validators, full body, parsed again
+    assert rows[0]["start_datetime"].date() == this_week + timedelta(days=7)
+    assert sent == [None, '"v1"', None]
+    assert cache.stats() == {"hits": 1, "misses": 2}
+    assert strategies.stats() == {"http": 3, "browser": 0}
+
+def test_parse_pool_returns_same_rows_as_inline(monkeypatch):
+    import asyncio
+    from zoneinfo import ZoneInfo
+    from app.collectors import parse_pool
+    from app.collectors.common import Facility, facility_fields, rows_from_tuples
+    from app.collectors.facility_pages import _parse_job, parse_dropin_html
+
+    tz = ZoneInfo("America/Toronto")
+    fac = Facility("trinity", "Trinity", "South", "155 Crawford St", dropin_page_url="https://x/dropin")
+    body = ("<h2>Drop-in Programs</h2><p>For the week of September 1, 2025</p><h3>Tuesday</h3>"
+            "<p>Volleyball - Adult 7:00 PM - 9:00 PM 19+ $5.00</p><p>Badminton 6:00 PM - 8:00 PM</p>").encode()
+    monkeypatch.setattr(parse_pool.settings.app, "parse_workers", 2)
+    try:
+        tuples, parse_s, norm_s, undated = asyncio.run(parse_pool.run(_parse_job, body, facility_fields(fac), fac.dropin_page_url, tz.key))
+    finally:
+        parse_pool.shutdown()
+    drop_seen = lambda rows: [{k: v for k, v in r.items() if k != "last_seen"} for r in rows]
+    assert drop_seen(rows_from_tuples(fac, fac.dropin_page_url, tuples, tz)) == drop_seen(parse_dropin_html(body, fac, tz))
+    assert len(tuples) == 1 and parse_s >= 0 and norm_s >= 0 and not undated
+
+def test_parse_pool_recovers_from_a_killed_child(monkeypatch):
+    import asyncio, os, signal
+    from app.collectors import parse_pool
+    monkeypatch.setattr(parse_pool.settings.app, "parse_workers", 2)
+    try:
+        child = asyncio.run(parse_pool.run(os.getpid))
+        broken = parse_pool._pool
+        os.kill(child, signal.SIGKILL)  # what the OOM killer does
+        assert asyncio.run(parse_pool.run(os.getpid)) not in (child, os.getpid())
+        assert parse_pool._pool is not broken
+    finally:
+        parse_pool.shutdown()
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from app.db import upsert_dropins
+
+TZ = ZoneInfo("America/Toronto")
+
+def test_upsert_dropins_counts_and_last_seen(engine, dropin_row):
+    stats = upsert_dropins(engine, [dropin_row(18), dropin_row(20), dropin_row(20)])
+    assert stats == {"inserted": 2, "updated": 0, "unchanged": 0}
+
+    later = datetime(2025, 9, 2, 2, 30, tzinfo=TZ)
+    rows = [dropin_row(18, seen=later), dropin_row(20, fee=6.0, seen=later), dropin_row(21)]
+    stats = upsert_dropins(engine, rows, batch_size=2)
+    assert stats == {"inserted": 1, "updated": 1, "unchanged": 1}
+
+    with engine.begin() as c:
+        assert c.execute(text("SELECT COUNT(*) FROM dropins")).scalar() == 3
+        seen = c.execute(text("SELECT COUNT(*) FROM dropins WHERE last_seen = :t"), {"t": later}).scalar()
+        fee = c.execute(text("SELECT fee_cad FROM dropins WHERE start_datetime = :s"), {"s": dropin_row(20)["start_datetime"]}).scalar()
+    assert seen == 2 and fee == 6.0
+
+def test_day_query_uses_start_index(engine, dropin_row):
+    from datetime import date
+    from app.db import DAY_SQL, day_bounds
+    upsert_dropins(engine, [dropin_row(h) for h in range(8, 22)])
+    day_start, next_day_start = day_bounds(date(2025, 9, 2), TZ)
+    params = {"day_start": day_start, "next_day_start": next_day_start}
+    with engine.begin() as c:
+        plan = " ".join(str(r[-1]) for r in c.execute(text("EXPLAIN QUERY PLAN " + DAY_SQL), params))
+        assert "USING INDEX ix_dropins_start" in plan
+        assert len(c.execute(text(DAY_SQL), params).all()) == 14
+
+def test_day_bounds_dst():
+    from datetime import date, timezone
+    from app.db import day_bounds
+    start, end = day_bounds(date(2025, 11, 2), TZ)  # fall back: 25h day
+    assert end.astimezone(timezone.utc) - start.astimezone(timezone.utc) == timedelta(hours=25)
+
+def test_sqlite_epoch_timestamps_and_legacy_text(engine, dropin_row):
+    from datetime import date
+    from app.db import DAY_SQL, MIGRATIONS, as_datetime, day_bounds
+    # 1am on the fall-back day exists twice; both must land inside that day
+    first = datetime(2025, 11, 2, 1, 30, tzinfo=TZ)
+    second = datetime(2025, 11, 2, 1, 30, fold=1, tzinfo=TZ)
+    seen = datetime(2025, 11, 1, 2, 30, 0, 250000, tzinfo=TZ)
+    upsert_dropins(engine, [dict(dropin_row(18, seen=seen), start_datetime=first, program_name="A"),
+                         dict(dropin_row(18), start_datetime=second, program_name="B")])
+    with engine.begin() as c:
+        assert {r[0] for r in c.execute(text("SELECT typeof(start_datetime) FROM dropins"))} == {"integer"}
+        # sub-second values survive the conversion
+        assert as_datetime(c.execute(text("SELECT last_seen FROM dropins WHERE program_name = 'A'")).scalar()) == seen
+        # a row written as text by an older version
+        c.execute(text("INSERT INTO dropins SELECT NULL, facility_id, facility_name, district, address, 'C',"
+                       " age_min, age_max, weekday, '2025-11-02 23:30:00-05:00', end_datetime, fee_cad,"
+                       " reserve_required, source_url, last_seen FROM dropins LIMIT 1"))
+        for stmt in dict(MIGRATIONS)[9]:
+            c.execute(text(stmt[1]))
+        day_start, next_day_start = day_bounds(date(2025, 11, 2), TZ)
+        rows = c.execute(text(DAY_SQL), {"day_start": day_start, "next_day_start": next_day_start}).all()
+    assert [r.program_name for r in rows] == ["A", "B", "C"]
+    assert as_datetime(rows[1].start_datetime, TZ) == second and as_datetime(rows[1].start_datetime, TZ).fold == 1
+
+def test_sqlite_pragmas_and_readonly_web_url(tmp_path, monkeypatch):
+    from app import db
+    url = f"sqlite:///{tmp_path / 'wal.sqlite3'}"
+    monkeypatch.setenv("APP__DB_URL", url)
+    monkeypatch.setattr(db, "_engine", None)
+    eng = db.get_engine()
+    with eng.connect() as c:
+        assert c.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert c.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+    assert db._async_url(url) == f"sqlite+aiosqlite:///file:{tmp_path / 'wal.sqlite3'}?mode=ro&uri=true"
+    assert db._async_url("sqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+    assert db._async_url("sqlite:////srv/my data/#1%.sqlite3") == \
+        "sqlite+aiosqlite:///file:/srv/my%20data/%231%25.sqlite3?mode=ro&uri=true"
+    eng.dispose()
+
+def test_sqlite_dropins_ids_are_filled_and_legacy_tables_rebuilt(engine, dropin_row):
+    from app.db import _DROPINS_DDL, MIGRATIONS
+    upsert_dropins(engine, [dropin_row(18), dropin_row(20)])
+    with engine.begin() as c:
+        assert c.execute(text("SELECT COUNT(*) FROM dropins WHERE id IS NULL")).scalar() == 0
+        # a table created by migration 1 before the rebuild: BIGSERIAL ids stay NULL
+        c.execute(text("DROP TABLE dropins"))
+        c.execute(text(_DROPINS_DDL))
+        c.execute(text("INSERT INTO dropins (facility_id, facility_name, program_name, start_datetime,"
+                       " end_datetime, last_seen) VALUES ('a', 'A', 'P', 1, 2, 3), ('b', 'B', 'P', 1, 2, 3)"))
+        assert c.execute(text("SELECT COUNT(*) FROM dropins WHERE id IS NULL")).scalar() == 2
+        for stmt in dict(MIGRATIONS)[10]:
+            c.execute(text(stmt[1]))
+        assert c.execute(text("SELECT id, facility_id FROM dropins ORDER BY id")).all() == [(1, "a"), (2, "b")]
+        assert {r[1] for r in c.execute(text("PRAGMA index_list(dropins)"))} >= {"ix_dropins_start", "ix_dropins_weekday_start"}
+    upsert_dropins(engine, [dropin_row(18)])
+    with engine.begin() as c:
+        assert c.execute(text("SELECT MAX(id) FROM dropins")).scalar() == 3
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from app.dropin_index import DropinIndex, decode_cursor
+
+TZ = ZoneInfo("America/Toronto")
+NOW = datetime(2025, 9, 1, tzinfo=TZ).timestamp()
+
+def _row(fid, district, day, hour, age_min=None, age_max=None, fee=None):
+    start = datetime(2025, 9, day, hour, 0, tzinfo=TZ)
+    return {
+        "facility_id": fid, "facility_name": fid.title(), "district": district,
+        "address": "", "program_name": "Volleyball Drop-in",
+        "age_min": age_min, "age_max": age_max,
+        "start_datetime": start, "end_datetime": start + timedelta(hours=2),
+        "fee_cad": fee, "reserve_required": False, "source_url": None,
+    }
+
+ROWS = [
+    _row("trinity", "Toronto & East York", 2, 19, age_min=19),   # Tue
+    _row("trinity", "Toronto & East York", 2, 12),               # Tue noon
+    _row("wellesley", "Toronto & East York", 2, 18, age_min=13, age_max=18),
+    _row("scadding", "Toronto & East York", 2, 20, fee=8.0),
+    _row("agincourt", "Scarborough", 2, 19),
+    _row("trinity", "Toronto & East York", 3, 19),               # Wed
+]
+
+def test_filters():
+    idx = DropinIndex(ROWS, TZ)
+    rows, cur = idx.query(weekday=1, after_minute=18 * 60, district="east york", age=25, now=NOW)
+    assert [r["facility_id"] for r in rows] == ["trinity", "scadding"]
+    assert cur is None
+    rows, _ = idx.query(weekday=1, after_minute=18 * 60, district="east york", age=25, max_fee=5, now=NOW)
+    assert [r["facility_id"] for r in rows] == ["trinity"]
+
+def test_keyset_pagination():
+    idx = DropinIndex(ROWS, TZ)
+    seen, cursor = [], None
+    while True:
+        page, nxt = idx.query(cursor=decode_cursor(cursor) if cursor else None, limit=2, now=NOW)
+        seen.extend((r["start_datetime"], r["facility_id"]) for r in page)
+        if not nxt:
+            break
+        cursor = nxt
+    assert len(seen) == len(ROWS) and seen == sorted(seen)
+
+def test_ended_sessions_drop_out_between_rebuilds():
+    idx = DropinIndex(ROWS, TZ)
+    # Tuesday 20:30: the noon and 18:00 sessions are over, the 19:00 ones still running
+    rows, _ = idx.query(weekday=1, now=datetime(2025, 9, 2, 20, 30, tzinfo=TZ).timestamp())
+    assert [(r["facility_id"], r["start_datetime"][11:16]) for r in rows] == \
+        [("agincourt", "19:00"), ("trinity", "19:00"), ("scadding", "20:00")]
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import text
+from app.jobs import JobConflict, _finish, create_job, get_job
+
+def test_single_flight_join_and_release(engine):
+    first, created = create_job(engine)
+    assert created
+    assert create_job(engine) == (first, False)
+    with pytest.raises(JobConflict) as e:  # a dry run must not join a live refresh
+        create_job(engine, "dry_run")
+    assert (e.value.job_id, e.value.kind) == (first, "refresh")
+    _finish(engine, first, "done", result={"inserted": 3})
+    assert get_job(engine, first)["result"] == {"inserted": 3}
+    second, created = create_job(engine)
+    assert created and second != first
+
+def test_stale_job_is_reaped(engine):
+    dead, _ = create_job(engine)
+    with engine.begin() as c:
+        c.execute(text("UPDATE refresh_jobs SET status = 'running', heartbeat_at = :t WHERE id = :id"),
+                  {"t": datetime.now(timezone.utc) - timedelta(hours=1), "id": dead})
+    fresh, created = create_job(engine)
+    assert created and fresh != dead
+    assert get_job(engine, dead)["status"] == "failed"
+
+def test_dry_run_reads_the_file_until_the_table_is_seeded(engine, tmp_path, monkeypatch):
+    import json
+    from app import jobs, refresh
+    from app.settings import settings
+    path = tmp_path / "facilities.json"
+    path.write_text(json.dumps([{"facility_id": "a", "facility_name": "A"}]))
+    monkeypatch.setattr(settings.paths, "facilities_file", str(path))
+    monkeypatch.setattr(jobs, "get_engine", lambda: engine)
+    seen = []
+
+    async def collect_all(facilities, tz, progress=None):
+        seen.extend(f.facility_id for f in facilities)
+        return [], []
+
+    monkeypatch.setattr(refresh, "collect_all", collect_all)
+    assert jobs._dry_run(None)["found"] == 0
+    assert seen == ["a"]
+    with engine.begin() as c:  # and nothing was written
+        assert c.execute(text("SELECT COUNT(*) FROM facilities")).scalar() == 0
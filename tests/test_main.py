@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import pytest
+from icalendar import Calendar
+from fastapi.testclient import TestClient
+from app import db
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("APP__DB_URL", f"sqlite:///{tmp_path / 'web.sqlite3'}")
+    monkeypatch.setattr(db, "_engine", None)
+    monkeypatch.setattr(db, "_async_engine", None)
+    from app import main
+    from app.cache import GenerationClock, ResponseCache
+    from app.dropin_index import IndexHolder
+    # per-process caches would otherwise leak between test databases
+    monkeypatch.setattr(main, "_generation", GenerationClock(ttl=0))
+    monkeypatch.setattr(main, "_responses", ResponseCache())
+    monkeypatch.setattr(main, "_feeds", ResponseCache())
+    monkeypatch.setattr(main, "_index", IndexHolder(main.TZ))
+    app = main.app
+    with TestClient(app) as c:  # runs the lifespan: migrations + pool warm-up
+        yield c
+
+def test_startup_builds_async_pool(client):
+    assert db._async_engine is not None and db._engine is not None
+    for _ in range(50):  # warm-up runs as a task right after startup
+        r = client.get("/ready")
+        if r.status_code == 200:
+            break
+    assert r.json()["ready"] is True and "warmup_seconds" in r.json()
+    assert client.get("/db_ping").json() == {"ok": True}
+    first = client.get("/count")
+    assert first.json() == {"rows": 0}
+    assert client.get("/count", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+def test_ics_feeds_cached_per_generation(client, dropin_row):
+    from app.main import TZ
+    start = (datetime.now(TZ) + timedelta(days=2)).replace(hour=19, minute=0, second=0, microsecond=0)
+    rows = [dict(dropin_row(18), start_datetime=start + timedelta(days=7 * i),
+                 end_datetime=start + timedelta(days=7 * i, hours=2)) for i in range(3)]
+    db.upsert_dropins(db.get_engine(), rows)
+    db.bump_generation(db.get_engine())
+
+    gz = client.get("/ics/facility/trinity.ics")
+    assert gz.headers["content-encoding"] == "gzip"
+    assert len(Calendar.from_ical(gz.content).walk("VEVENT")) == 3
+    assert client.get("/ics/facility/trinity.ics", headers={"If-None-Match": gz.headers["etag"]}).status_code == 304
+
+    plain = client.get("/ics", params={"id": "trinity"}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.headers["etag"] != gz.headers["etag"]
+    assert plain.content.count(b"BEGIN:VEVENT") == 3
+    day = start.strftime("%a")
+    assert client.get(f"/ics/day/{day}.ics").content.count(b"BEGIN:VEVENT") == 3
+    assert client.get("/ics/district/north.ics").content.count(b"BEGIN:VEVENT") == 0
+    assert client.get("/ics/day/Funday.ics").status_code == 400
+
+def test_metrics_exposes_route_latency_and_pool(client):
+    client.get("/ics/day/Mon.ics")
+    body = client.get("/metrics").text
+    assert 'quickset_http_request_seconds_count{method="GET",route="/ics/day/{day}.ics",status="200"}' in body
+    assert 'quickset_db_pool_connections{state="size"} 5.0' in body
+
+def test_day_snapshots_fast_path_and_fallback(client, dropin_row, tmp_path, monkeypatch):
+    from app.main import TZ
+    from app.settings import settings
+    from app.snapshots import write_snapshots
+    monkeypatch.setattr(settings.paths, "snapshot_dir", str(tmp_path / "snap"))
+    today = datetime.now(TZ).date()
+    start = datetime(today.year, today.month, today.day, 19, tzinfo=TZ)
+    db.upsert_dropins(db.get_engine(), [dict(dropin_row(19), start_datetime=start, end_datetime=start + timedelta(hours=2))])
+    gen = db.bump_generation(db.get_engine())
+
+    dynamic = client.get(f"/day/{today}.json", headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in dynamic.headers and len(dynamic.json()["rows"]) == 1
+    html = client.get("/", params={"day": today.isoformat()}).text
+
+    write_snapshots(db.get_engine(), gen, TZ, days=2)
+    snap = client.get(f"/day/{today}.json", headers={"Accept-Encoding": "gzip, br"})
+    assert snap.headers["content-encoding"] == "br" and snap.headers["vary"] == "Accept-Encoding"
+    assert snap.content == dynamic.content
+    plain = client.get("/", params={"day": today.isoformat()}, headers={"Accept-Encoding": "identity"})
+    assert plain.text == html
+    assert client.get(f"/day/{today}.json", headers={"If-None-Match": snap.headers["etag"],
+                                                      "Accept-Encoding": "br"}).status_code == 304
+    # outside the snapshot window: rendered on demand
+    assert client.get(f"/day/{today + timedelta(days=5)}.json").json()["rows"] == []
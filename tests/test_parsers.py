@@ -21,3 +21,21 @@ def test_parse_week_header():
     from app.parsers import parse_week_header
     d = parse_week_header("For the week of 2025-09-01")
     assert d.isoformat() == "2025-09-01"
+
+def test_parse_time_range_fast_path_matches_dateutil():
+    from app.parsers import _parse_time_range_slow
+    samples = [
+        "07:30 PM - 09:30 PM", "7:30PM-9:30PM", "7pm to 9pm", "6:00 p.m. – 8:00 p.m.",
+        "12:00 PM - 1:30 PM", "12:15 AM - 2:00 AM", "19:00 - 21:30", "7:30 - 9:30 PM",
+        "11:00 PM - 01:00 AM", "7:00 PM",
+    ]
+    for text in samples:
+        assert parse_time_range(text, date(2025, 9, 1), TZ) == _parse_time_range_slow(text, date(2025, 9, 1), TZ), text
+
+def test_parse_time_range_memo_is_dst_safe():
+    # same memoized text on both sides of the November fall-back
+    s1, _ = parse_time_range("07:30 PM - 09:30 PM", date(2025, 10, 28), TZ)
+    s2, _ = parse_time_range("07:30 PM - 09:30 PM", date(2025, 11, 4), TZ)
+    assert (s1.hour, s2.hour) == (19, 19)
+    assert s1.utcoffset().total_seconds() == -4 * 3600
+    assert s2.utcoffset().total_seconds() == -5 * 3600
@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+import pytest
+from app.parsers import parse_age_range, parse_time_range, _parse_time_range_slow
+
+pytest.importorskip("pytest_benchmark")
+
+TZ = ZoneInfo("America/Toronto")
+# a refresh sees a few dozen distinct strings thousands of times
+TIMES = [f"{h:02d}:{m:02d} PM - {h + 2:02d}:{m:02d} PM" for h in range(1, 9) for m in (0, 15, 30, 45)]
+AGES = ["19+", "13-18", "13–18", "All ages", "Adults (19 years and older)", "16+"]
+DAYS = [date(2025, 9, 1) + timedelta(days=i) for i in range(7)]
+
+def _run(fn, n=3000):
+    for i in range(n):
+        fn(TIMES[i % len(TIMES)], DAYS[i % 7], TZ)
+
+def test_bench_parse_time_range(benchmark):
+    benchmark(_run, parse_time_range)
+
+def test_bench_parse_time_range_dateutil(benchmark):
+    benchmark.pedantic(_run, args=(_parse_time_range_slow,), rounds=3, iterations=1)
+
+def test_bench_parse_age_range(benchmark):
+    benchmark(lambda: [parse_age_range(AGES[i % len(AGES)]) for i in range(3000)])
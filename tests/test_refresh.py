@@ -0,0 +1,24 @@
+import asyncio
+from sqlalchemy import text
+from app.refresh import RowWriter
+
+def test_writer_flushes_in_batches_and_active_wins(engine, dropin_row):
+    def _page_row(hour, fee):
+        return dict(dropin_row(hour, fee=fee), source_url="https://example.com/page")
+
+    writer = RowWriter(engine, batch_rows=2, flush_seconds=60, maxsize=1)
+
+    async def pipeline():
+        task = asyncio.create_task(writer.run())
+        await writer.put("facility_page", [_page_row(18, 9.0), _page_row(19, 9.0)])
+        await writer.put("active", [dropin_row(18, fee=5.0)])
+        await writer.put("facility_page", [_page_row(18, 7.0)])  # must not overwrite Active
+        await writer.close()
+        await task
+
+    asyncio.run(pipeline())
+    assert writer.found == 4 and writer.flushes == 2
+    assert writer.stats["inserted"] == 2
+    with engine.begin() as c:
+        fees = dict(c.execute(text("SELECT source_url, fee_cad FROM dropins")).all())
+    assert fees == {"https://example.com": 5.0, "https://example.com/page": 9.0}
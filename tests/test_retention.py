@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from app.db import upsert_dropins
+from app.refresh import Facility
+from app.retention import run_retention
+from app.scheduler import record_outcomes
+from app.settings import settings
+
+TZ = ZoneInfo("America/Toronto")
+NOW = datetime(2025, 9, 10, 12, 0, tzinfo=TZ)
+
+def _row(fid, start, seen):
+    return {
+        "facility_id": fid, "facility_name": fid, "district": "South", "address": "1 Main St",
+        "program_name": f"Volleyball {start:%H%M}", "age_min": 19, "age_max": None,
+        "weekday": start.weekday(), "start_datetime": start, "end_datetime": start + timedelta(hours=2),
+        "fee_cad": 5.0, "reserve_required": False, "source_url": f"https://x/{fid}", "last_seen": seen,
+    }
+
+def test_past_and_unseen_rows_move_in_batches(engine, monkeypatch):
+    monkeypatch.setattr(settings.app, "retention_batch_size", 2)
+    monkeypatch.setattr(settings.app, "retention_pause_seconds", 0)
+    fresh, stale = NOW - timedelta(hours=1), NOW - timedelta(days=5)
+    rows = [_row("a", NOW - timedelta(days=d, hours=1), fresh) for d in (2, 3, 4)]  # over
+    rows.append(_row("a", NOW - timedelta(hours=20), fresh))  # yesterday: kept
+    rows.append(_row("a", NOW + timedelta(days=1), fresh))
+    rows.append(_row("a", NOW + timedelta(days=2, hours=1), stale))  # dropped from a's page
+    rows.append(_row("b", NOW + timedelta(days=2, hours=2), stale))  # b's crawls keep failing
+    upsert_dropins(engine, rows)
+    facs = [Facility(facility_id=f, facility_name=f, active_search_url="https://x") for f in "ab"]
+    record_outcomes(engine, facs, {"a": {"active": {"status": "done"}}, "b": {"active": {"status": "failed"}}},
+                    None, NOW.astimezone(timezone.utc) - timedelta(hours=2))
+
+    assert run_retention(engine, now=NOW, dry_run=True)["archived"] == {"past": 3, "unseen": 1}
+    report = run_retention(engine, now=NOW)
+    assert report["archived"] == {"past": 3, "unseen": 1}
+    assert (report["hot_rows_before"], report["hot_rows_after"]) == (7, 3)
+    assert report["reclaimed_bytes"] >= 0
+    with engine.begin() as c:
+        left = {r[0] for r in c.execute(text("SELECT facility_id || ':' || program_name FROM dropins"))}
+        archived = c.execute(text("SELECT archive_reason, COUNT(*) FROM dropins_archive "
+                                  "GROUP BY archive_reason ORDER BY 1")).all()
+    assert len(left) == 3 and any(k.startswith("b:") for k in left)
+    assert [tuple(r) for r in archived] == [("past", 3), ("unseen", 1)]
+    assert run_retention(engine, now=NOW)["archived"] == {"past": 0, "unseen": 0}
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+from app.refresh import Facility
+from app.scheduler import load_state, pick_due, record_outcomes
+
+class _Cache:
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+    def facility_hash(self, fid):
+        return self.hashes.get(fid)
+
+def _facs(*ids):
+    return [Facility(facility_id=i, facility_name=i, active_search_url=f"https://x/{i}") for i in ids]
+
+def test_due_order_backoff_and_deferral(engine):
+    now = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+    facs = _facs("a", "b", "c")
+    assert [f.facility_id for f in pick_due(engine, facs, now)] == ["a", "b", "c"]  # never crawled
+
+    progress = {"a": {"active": {"status": "done"}}, "b": {"active": {"status": "failed"}},
+                "c": {"active": {"status": "deferred"}}}
+    counts = record_outcomes(engine, facs, progress, _Cache({"a": "h1"}), now)
+    assert counts == {"done": 1, "failed": 1, "deferred": 1, "changed": 1}
+    state = load_state(engine)
+    assert "c" not in state
+    assert state["b"]["failure_count"] == 1
+    assert state["b"]["next_due"] - now <= timedelta(minutes=15 * 1.1)
+    # a just changed -> the shorter interval
+    assert timedelta(hours=5) < state["a"]["next_due"] - now < timedelta(hours=7)
+
+    # c is still never-crawled and comes first; b is due after its backoff
+    later = now + timedelta(minutes=20)
+    assert [f.facility_id for f in pick_due(engine, facs, later)] == ["c", "b"]
+    assert [f.facility_id for f in pick_due(engine, facs, later, limit=1)] == ["c"]
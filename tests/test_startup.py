@@ -0,0 +1,26 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# generous: fastapi/pydantic dominate; the point is catching a crawler import
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "3000"))
+CRAWLER_MODULES = ("playwright", "bs4", "lxml", "httpx", "icalendar", "dateutil", "app.refresh", "app.collectors")
+
+def _importtime(module: str):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    rows = {}
+    for line in out.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m:
+            rows[m.group(4)] = int(m.group(2))
+    return rows
+
+def test_web_process_import_is_lean():
+    rows = _importtime("app.main")
+    loaded = [m for m in rows if any(m == c or m.startswith(c + ".") for c in CRAWLER_MODULES)]
+    assert loaded == []
+    assert rows["app.main"] / 1000 < BUDGET_MS
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from app.facilities import Facility, db_facilities, ensure_facilities, import_facilities
+from app.scheduler import claim_due, release_leases, renew_leases
+from app.settings import settings
+
+def test_seed_and_prune(engine, tmp_path, monkeypatch):
+    path = tmp_path / "facilities.json"
+    path.write_text(json.dumps([{"facility_id": "a", "facility_name": "A", "dropin_selector": "#sched"},
+                                {"facility_id": "b", "facility_name": "B"}]))
+    monkeypatch.setattr(settings.paths, "facilities_file", str(path))
+    facs = ensure_facilities(engine)
+    assert [f.facility_id for f in facs] == ["a", "b"] and facs[0].dropin_selector == "#sched"
+    assert import_facilities(engine, [Facility("b", "B2")], prune=True) == {"upserted": 1, "removed": 1}
+    assert [(f.facility_id, f.facility_name) for f in db_facilities(engine)] == [("b", "B2")]
+
+def test_leases_split_work_and_lapse(engine):
+    import_facilities(engine, [Facility(i, i) for i in "abc"])
+    now = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+    first = claim_due(engine, "w1", now, limit=2)
+    second = claim_due(engine, "w2", now, limit=2)
+    assert len(first) == 2 and len(second) == 1 and not set(first) & set(second)
+    assert claim_due(engine, "w3", now) == []
+    assert [f.facility_id for f in db_facilities(engine, unleased_at=now)] == []
+
+    # w1 keeps heartbeating, w2 dies: only w2's facility is up for grabs later
+    later = now + timedelta(seconds=settings.app.worker_lease_seconds - 1)
+    assert renew_leases(engine, "w1", later) == 2
+    after_expiry = now + timedelta(seconds=settings.app.worker_lease_seconds + 1)
+    assert claim_due(engine, "w3", after_expiry) == second
+
+    release_leases(engine, "w1", first)
+    assert sorted(claim_due(engine, "w4", after_expiry)) == sorted(first)
+
+def test_refresh_style_claims_cover_facilities_not_yet_due(engine):
+    import_facilities(engine, [Facility(i, i) for i in "ab"])
+    now = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+    with engine.begin() as c:
+        c.execute(text("INSERT INTO facility_state (facility_id, failure_count, next_due) VALUES ('a', 0, :t)"),
+                  {"t": now + timedelta(hours=1)})
+    assert claim_due(engine, "cron", now) == ["b"]
+    assert claim_due(engine, "w1", now, due_only=False) == ["a"]  # --all: anything not leased
+
+def test_parse_pool_outlives_worker_rounds(engine, tmp_path, monkeypatch):
+    from app import db, worker
+    from app.collectors import parse_pool
+    from app.refresh import run_refresh
+    monkeypatch.setattr(db, "_engine", engine)
+    monkeypatch.setattr(settings.paths, "metrics_textfile", str(tmp_path / "refresh.prom"))
+    monkeypatch.setattr(settings.app, "parse_workers", 2)
+    pool = parse_pool._get()
+    try:
+        run_refresh(claimed=[])  # a worker round: the pool stays up for the next one
+        assert parse_pool._pool is pool
+        monkeypatch.setattr(worker.signal, "signal", lambda *a: None)
+        monkeypatch.setattr(worker, "run_round", lambda *a: None)
+        worker.run_worker(once=True)
+        assert parse_pool._pool is None  # the worker shuts it down on exit
+    finally:
+        parse_pool.shutdown()